@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def _is_recipe(key):
+    """Whether a cache key is a single recipe's URL (/recipes/<id>)"""
+    path, params = key
+    return not params and path.startswith('/recipes/') and path[len('/recipes/'):].isdigit()
+
+
+class RecipeClient:
+    """Talks to the Flask API over one pooled keep-alive session
+
+    GET responses are cached per URL. Within ttl seconds they're served without
+    a request at all. After that the client asks the server's change feed what
+    changed since it last looked: single recipes are patched from the feed,
+    everything else (lists, searches, stats) is dropped only if something
+    changed. follow() keeps that up to date from the event stream instead, so
+    cached responses are used until the server says otherwise. Against a server
+    without the feed, old responses are re-checked with If-None-Match so an
+    unchanged one costs a 304 instead of the whole body.
+    """
+
+    def __init__(self, base_url, timeout=(3.05, 10), ttl=1.0, pool_size=10, stream_timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout  # (connect, read) seconds
+        self.ttl = ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stream_timeout = stream_timeout  # the server sends a keep-alive every 5 seconds
+        self._cache = {}  # (path, params) -> (fetched_at, etag, data, headers)
+        self._lock = threading.Lock()
+        self._feed = None  # (server instance, version) the cache is current with, None before the first sync
+        self._has_feed = True  # False once the server turns out not to have one
+        self._synced_at = 0.0
+        self._following = False  # True while the event stream is connected
+        self._follower = None
+
+    @property
+    def data_version(self):
+        """The server's data version the cache is current with, or None if not known"""
+        feed = self._feed
+        return feed and f'{feed[0]}-{feed[1]}'
+
+    def _fresh(self, cached):
+        """Whether a cache entry can be used without asking the server"""
+        return self._following or time.monotonic() - max(cached[0], self._synced_at) < self.ttl
+
+    def _get(self, path, params=None):
+        """GET a JSON response, returning (status code, data, headers)"""
+        key = (path, tuple(sorted((params or {}).items())))
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and not self._fresh(cached) and self._has_feed and self.sync():
+            # one small request tells us about every cached response at once
+            with self._lock:
+                cached = self._cache.get(key)
+        if cached and self._fresh(cached):
+            return 200, cached[2], cached[3]
+
+        feed = self._feed
+        headers = {'If-None-Match': cached[1]} if cached and cached[1] else {}
+        response = self.session.get(self.base_url + path, params=params, headers=headers,
+                                    timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            data, headers = cached[2], cached[3]
+        elif response.status_code == 200:
+            data, headers = response.json(), response.headers
+        else:
+            return response.status_code, None, response.headers
+
+        with self._lock:
+            # if a sync happened meanwhile, this response may be older than what it let through
+            if self._feed == feed:
+                self._cache[key] = (time.monotonic(), response.headers.get('ETag'), data, headers)
+        return 200, data, headers
+
+    def _send(self, method, path, **kwargs):
+        """Send a change to the API and bring the cache up to date with it"""
+        response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        if not self._has_feed or not self.sync():
+            self.invalidate()
+        return response
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+            self._feed = None
+
+    def sync(self):
+        """Apply what changed on the server since the last sync to the cache
+
+        Returns False if the change feed couldn't be read.
+        """
+        try:
+            response = self.session.get(self.base_url + '/recipes/changes', params={'since': self.data_version or ''},
+                                        timeout=self.timeout)
+        except requests.RequestException:
+            return False
+        if response.status_code == 404:
+            self._has_feed = False  # an older server, fall back to If-None-Match
+            return False
+        if response.status_code != 200:
+            return False
+        self._apply_changes(response.json())
+        return True
+
+    def _apply_changes(self, feed):
+        """Update the cache from one change feed reply (GET /recipes/changes or a stream event)"""
+        instance, _, version = feed['version'].rpartition('-')
+        version = int(version)
+        with self._lock:
+            if feed['reset'] or self._feed is None or instance != self._feed[0]:
+                self._cache.clear()
+            else:
+                if version < self._feed[1]:
+                    return  # a reply that got overtaken by a newer one
+                changed = {}
+                for change in feed['changes']:
+                    if change['version'] > self._feed[1]:
+                        changed[(f"/recipes/{change['id']}", ())] = change.get('recipe')
+                if changed:
+                    # single recipes can be patched, but any list, search or count could have changed
+                    now = time.monotonic()
+                    cache = {}
+                    for key, cached in self._cache.items():
+                        if key in changed:
+                            if changed[key] is not None:
+                                cache[key] = (now, None, changed[key], {})
+                        elif _is_recipe(key):
+                            cache[key] = cached
+                    self._cache = cache
+            self._feed = (instance, version)
+            self._synced_at = time.monotonic()
+
+    def follow(self):
+        """Keep the cache current from the server's event stream, on a background thread"""
+        if self._follower is None and self._has_feed:
+            self._follower = threading.Thread(target=self._follow, name='recipe-changes', daemon=True)
+            self._follower.start()
+
+    def _follow(self):
+        session = requests.Session()  # the stream holds its connection for minutes
+        while self._has_feed:
+            try:
+                with session.get(self.base_url + '/recipes/changes/stream', params={'since': self.data_version or ''},
+                                 stream=True, timeout=(self.timeout[0], self.stream_timeout)) as response:
+                    if response.status_code == 404:
+                        self._has_feed = False
+                        break
+                    if response.status_code == 200:
+                        self._read_stream(response)
+            except requests.RequestException:
+                pass
+            finally:
+                self._following = False
+            time.sleep(1)  # reconnect, the server closes every stream after a while
+
+    def _read_stream(self, response):
+        data = []
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith('data:'):
+                data.append(line[5:].lstrip())
+            elif not line and data:
+                self._apply_changes(json.loads('\n'.join(data)))
+                data = []
+                # the server replays anything after our version first, so once that's in we're current
+                self._following = self._feed is not None
+
+    def list_recipes(self, **params):
+        status, data, headers = self._get('/recipes', params)
+        return data if status == 200 else []
+
+    def list_page(self, offset, limit, fields=None, **params):
+        """Return (recipes, total) for one page, with only the given fields if any"""
+        if fields:
+            params['fields'] = ','.join(fields)
+        status, data, headers = self._get('/recipes', dict(params, offset=offset, limit=limit))
+        if status != 200:
+            return [], 0
+        return data, int(headers.get('X-Total-Count', len(data)))
+
+    def get_recipe(self, recipe_id):
+        status, data, headers = self._get(f'/recipes/{recipe_id}')
+        return data if status == 200 else None
+
+    def search_recipes(self, query):
+        status, data, headers = self._get('/recipes/search', {'q': query})
+        return data if status == 200 else []
+
+    def suggest(self, prefix, limit=10):
+        status, data, headers = self._get('/recipes/suggest', {'prefix': prefix, 'limit': limit})
+        return data if status == 200 else []
+
+    def similar(self, recipe_id, limit=10):
+        """Return [{'recipe', 'similarity'}] for recipes much like this one"""
+        status, data, headers = self._get(f'/recipes/{recipe_id}/similar', {'limit': limit})
+        return data if status == 200 else []
+
+    def match(self, ingredients, **options):
+        """Rank recipes by how much of them the ingredients cover, see POST /recipes/match"""
+        response = self.session.post(self.base_url + '/recipes/match', json=dict(options, ingredients=ingredients),
+                                     timeout=self.timeout)
+        return response.json() if response.status_code == 200 else []
+
+    def thumbnail(self, video_id):
+        """Return a video's thumbnail (JPEG bytes) from the API's cache, or None"""
+        response = self.session.get(f'{self.base_url}/thumbnails/{video_id}', timeout=self.timeout)
+        return response.content if response.status_code == 200 else None
+
+    def get_stats(self):
+        status, data, headers = self._get('/recipes/stats')
+        return data if status == 200 else None
+
+    def add_recipe(self, recipe_data):
+        return self._send('POST', '/recipes', json=recipe_data).status_code == 201
+
+    def edit_recipe(self, recipe_id, recipe_data):
+        return self._send('PUT', f'/recipes/{recipe_id}', json=recipe_data).status_code == 200
+
+    def delete_recipe(self, recipe_id):
+        return self._send('DELETE', f'/recipes/{recipe_id}').status_code == 200
+
+    def toggle_favorite(self, recipe_id):
+        return self._send('PUT', f'/recipes/{recipe_id}/favorite').status_code == 200
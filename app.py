@@ -1,8 +1,18 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import json
 import os
-from datetime import datetime
+import time
+import uuid
+from datetime import datetime, timezone
+from werkzeug.http import is_resource_modified
+from cache import ResponseCache
+import fastjson
+from export import EXPORTERS, FORMATS, parquet_available
+from metrics import instrument, metrics
+from models import recipe_fields, validate_recipe
+from storage import open_backend
+from store import RecipeStore
+from youtube import ThumbnailCache
 
 app = Flask(__name__)
 CORS(app)  # Allow requests from Streamlit
@@ -10,76 +20,295 @@ CORS(app)  # Allow requests from Streamlit
 # File to store recipes
 DATA_FILE = 'recipes.json'
 
-def load_recipes():
-    """Load recipes from JSON file"""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
-
-def save_recipes(recipes):
-    """Save recipes to JSON file"""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(recipes, f, indent=2)
-
-# Initialize with some sample data
-if not os.path.exists(DATA_FILE):
-    sample_recipes = [
-        {
-            "id": 1,
-            "name": "Pasta Carbonara",
-            "ingredients": ["pasta", "eggs", "bacon", "cheese", "pepper"],
-            "instructions": "Cook pasta. Mix eggs and cheese. Combine with hot pasta and bacon.",
-            "prep_time": 20,
-            "difficulty": "Easy",
-            "category": "Main Course",
-            "youtube_url": "",
-            "is_favorite": True,
-            "created_at": "2025-01-01"
-        },
-        {
-            "id": 2,
-            "name": "Chocolate Cookies",
-            "ingredients": ["flour", "butter", "sugar", "chocolate chips", "eggs"],
-            "instructions": "Mix ingredients. Bake at 350F for 12 minutes.",
-            "prep_time": 30,
-            "difficulty": "Easy",
-            "category": "Dessert",
-            "youtube_url": "https://www.youtube.com/watch?v=example",
-            "is_favorite": False,
-            "created_at": "2025-01-02"
-        }
-    ]
-    save_recipes(sample_recipes)
+# where recipes are kept: 'json' (DATA_FILE) or 'sqlite' (DATABASE_FILE)
+STORAGE_BACKEND = os.environ.get('RECIPE_STORAGE', 'json')
+DATABASE_FILE = os.environ.get('RECIPE_DATABASE', 'recipes.db')
+
+# set RECIPE_JOURNAL=1 to append changes to a log instead of rewriting the JSON file
+JOURNAL_MODE = os.environ.get('RECIPE_JOURNAL', '0') == '1'
+
+# set RECIPE_PROFILE_EVERY=N to run one request in N under cProfile, dumped to RECIPE_PROFILE_DIR
+PROFILE_EVERY = int(os.environ.get('RECIPE_PROFILE_EVERY', '0'))
+PROFILE_DIR = os.environ.get('RECIPE_PROFILE_DIR', 'profiles')
+
+# the recipes and indexes are pickled here on shutdown, so the next start loads them in one go
+# instead of parsing every recipe and rebuilding the indexes; set RECIPE_SNAPSHOT= to turn it off
+SNAPSHOT_FILE = os.environ.get('RECIPE_SNAPSHOT', 'recipes.snapshot')
+
+# per-route latency, storage and JSON timings, see GET /metrics
+instrument(app, profile_every=PROFILE_EVERY, profile_dir=PROFILE_DIR)
+
+# recipes are kept in memory and only re-read when the backend says they changed
+store = RecipeStore(open_backend(STORAGE_BACKEND, DATA_FILE, DATABASE_FILE, journal=JOURNAL_MODE),
+                    snapshot_path=SNAPSHOT_FILE or None)
+
+# serialized JSON for hot list and search responses, dropped whenever the data changes
+response_cache = ResponseCache()
+
+# unique per process, so two workers never hand out the same ETag for different data
+INSTANCE_TAG = uuid.uuid4().hex[:8]
+
+# fields GET /recipes can sort by
+SORT_FIELDS = ('prep_time', 'created_at', 'name')
+
+# how many matches GET /recipes/suggest returns by default, and at most
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+# how many recipes POST /recipes/match returns by default, and at most
+MATCH_LIMIT = 20
+MAX_MATCH_LIMIT = 500
+
+# a new recipe at least this similar to an existing one (Jaccard similarity of ingredients
+# and name words) is flagged as a possible duplicate when it's added
+DUPLICATE_SIMILARITY = 0.7
+DUPLICATE_LIMIT = 5
+
+# how many recipes GET /recipes/<id>/similar returns by default, and at most
+SIMILAR_LIMIT = 10
+MAX_SIMILAR_LIMIT = 100
+
+# GET /recipes/changes/stream checks for changes this often (seconds), sends a keep-alive
+# comment after this long without any, and closes after this long (clients reconnect).
+# Under `python app.py` a client that went away is only noticed when a write fails, so
+# the keep-alive is what frees its thread there; asgi.py notices within a poll.
+CHANGE_POLL_SECONDS = 1
+KEEPALIVE_SECONDS = 5
+CHANGE_STREAM_SECONDS = 120
+
+# video thumbnails are kept in THUMBNAIL_DIR (at most THUMBNAIL_MB) and downloaded in the
+# background by THUMBNAIL_WORKERS threads; GET /thumbnails waits this many seconds for a new one
+THUMBNAIL_DIR = os.environ.get('RECIPE_THUMBNAIL_DIR', 'thumbnails')
+THUMBNAIL_MB = int(os.environ.get('RECIPE_THUMBNAIL_MB', '100'))
+THUMBNAIL_WORKERS = int(os.environ.get('RECIPE_THUMBNAIL_WORKERS', '4'))
+THUMBNAIL_WAIT = 3
+
+# set thumbnails.fetcher to download from somewhere other than YouTube (tests use a stub);
+# the folder and download threads are only set up once a thumbnail is asked for
+thumbnails = ThumbnailCache(THUMBNAIL_DIR, max_bytes=THUMBNAIL_MB * 2 ** 20, workers=THUMBNAIL_WORKERS)
+
+# added to a store no recipe was ever added to
+sample_recipes = [
+    {
+        "name": "Pasta Carbonara",
+        "ingredients": ["pasta", "eggs", "bacon", "cheese", "pepper"],
+        "instructions": "Cook pasta. Mix eggs and cheese. Combine with hot pasta and bacon.",
+        "prep_time": 20,
+        "difficulty": "Easy",
+        "category": "Main Course",
+        "youtube_url": "",
+        "is_favorite": True,
+        "created_at": "2025-01-01"
+    },
+    {
+        "name": "Chocolate Cookies",
+        "ingredients": ["flour", "butter", "sugar", "chocolate chips", "eggs"],
+        "instructions": "Mix ingredients. Bake at 350F for 12 minutes.",
+        "prep_time": 30,
+        "difficulty": "Easy",
+        "category": "Dessert",
+        "youtube_url": "https://www.youtube.com/watch?v=example",
+        "is_favorite": False,
+        "created_at": "2025-01-02"
+    }
+]
+
+def start_up():
+    """Load the recipes before the first request, adding the samples if there were never any
+
+    Nothing is loaded when app.py is imported, so importing it stays quick;
+    a store nobody started loads on its first request instead.
+    """
+    store.seed_if_empty(sample_recipes)  # checks under the store's lock, so workers starting together add them once
+
+def shut_down():
+    """Save the snapshot the next start_up() loads from"""
+    store.save_snapshot()
 
 #home page
 @app.route('/')
 def home():
     return jsonify({"message": "Recipe Manager API is running!"})
 
+def project(recipe, fields):
+    """Keep only the requested fields of a recipe (the id is always kept)"""
+    if not fields:
+        return recipe
+    return {key: recipe[key] for key in fields if key in recipe}
+
+def conditional_get(build):
+    """Answer a GET with 304 if the client's copy is still current, otherwise with build(version)
+
+    The version is read before build() runs, so the data sent is never older
+    than the ETag that goes with it.
+    """
+    version, modified_at = store.version_info()
+    etag = f"{INSTANCE_TAG}-{version}"
+    last_modified = datetime.fromtimestamp(int(modified_at), timezone.utc)
+    if int(time.time()) <= int(modified_at):
+        # Last-Modified only has whole seconds, so until this second is over another change
+        # could get the same date; till then only the ETag is sent and checked
+        last_modified = None
+    
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        response = app.make_response(build(version))
+    
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'  # always check back with us
+    return response
+
+def cached_json(version, build):
+    """Return this URL's JSON response from the cache, calling build() -> (data, headers) on a miss
+
+    data may already be encoded JSON bytes.
+    """
+    key = request.full_path
+    cached = response_cache.get(key, version)
+    if cached is None:
+        data, headers = build()
+        cached = (data if isinstance(data, bytes) else app.json.dumps(data), headers)
+        response_cache.put(key, version, cached)
+    
+    body, headers = cached
+    return Response(body, mimetype='application/json', headers=headers)
+
+def prefetch_thumbnails(recipes):
+    """Start downloading the thumbnails of newly saved recipes' videos"""
+    for recipe in recipes:
+        if recipe.youtube_id:
+            thumbnails.prefetch(recipe.youtube_id)
+
+def possible_duplicates(recipe):
+    """Return {id, name, similarity} for existing recipes that look like the same recipe"""
+    similar = store.similar(recipe.id, limit=DUPLICATE_LIMIT, min_similarity=DUPLICATE_SIMILARITY) or []
+    return [{"id": match['recipe'].id, "name": match['recipe'].name, "similarity": round(match['similarity'], 3)}
+            for match in similar]
+
+def parse_version(token):
+    """Turn a change feed version (or an ETag) from this process into a store version, or -1"""
+    tag, _, version = (token or '').strip('"').rpartition('-')
+    if tag != INSTANCE_TAG or not version.isdigit():
+        return -1  # another worker's or an old process's, so the client has to start over
+    return int(version)
+
+def change_feed(version):
+    """Build the JSON for what changed since a store version
+
+    "reset" is true when the changes don't go back that far, then the client
+    should fetch everything again and continue from "version".
+    """
+    current, changes = store.changes_since(version)
+    feed = []
+    for change_version, recipe_id, recipe in changes or ():
+        if recipe is None:
+            feed.append({"version": change_version, "op": "delete", "id": recipe_id})
+        else:
+            feed.append({"version": change_version, "op": "put", "id": recipe_id, "recipe": recipe})
+    with metrics.timer('recipe_json_seconds', op='serialize'):
+        return current, fastjson.dumps({"version": f"{INSTANCE_TAG}-{current}", "reset": changes is None,
+                                        "changes": feed})
+
+def parse_filters(args):
+    """Turn the filter and sort query params into store.query() arguments
+
+    Raises ValueError for values we can't use.
+    """
+    equals = {}
+    for field in ('category', 'difficulty'):
+        if args.get(field):
+            equals[field] = args[field]
+    if args.get('favorite'):
+        favorite = args['favorite'].lower()
+        if favorite not in ('true', 'false', '1', '0'):
+            raise ValueError("favorite must be true or false")
+        equals['is_favorite'] = favorite in ('true', '1')
+    
+    ranges = {}
+    min_prep = args.get('min_prep_time')
+    max_prep = args.get('max_prep_time')
+    if min_prep or max_prep:
+        try:
+            ranges['prep_time'] = (int(min_prep) if min_prep else None, int(max_prep) if max_prep else None)
+        except ValueError:
+            raise ValueError("min_prep_time and max_prep_time must be whole numbers")
+    
+    sort = args.get('sort') or None
+    descending = False
+    if sort:
+        descending = sort.startswith('-')
+        sort = sort.lstrip('-')
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)} (prefix with - for descending)")
+    
+    return {"equals": equals, "ranges": ranges, "sort": sort, "descending": descending}
+
 #get all recipes
 @app.route('/recipes', methods=['GET'])
 def get_recipes():
-    """Get all recipes"""
-    recipes = load_recipes()
-    return jsonify(recipes)
+    """Get all recipes, optionally filtered, sorted and one page at a time
+
+    Query params: category, difficulty, favorite, min_prep_time, max_prep_time,
+    sort (prep_time, created_at or name, -prep_time for descending), limit,
+    offset, fields=name,prep_time,... and format=ndjson to stream one recipe
+    per line instead of building a single JSON array.
+    """
+    try:
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if (limit is not None and limit < 0) or offset < 0:
+            return jsonify({"error": "limit and offset can't be negative"}), 400
+        
+        fields = None
+        if request.args.get('fields'):
+            fields = ['id'] + [f.strip() for f in request.args['fields'].split(',') if f.strip() != 'id']
+        
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if request.args.get('format') == 'ndjson':
+            def build(version):
+                recipes, total = store.query(offset=offset, limit=limit, encoded=not fields, **filters)
+                if fields:
+                    with metrics.timer('recipe_json_seconds', op='serialize'):
+                        recipes = [fastjson.dumps(project(recipe, fields)) for recipe in recipes]
+                def generate():
+                    for recipe in recipes:
+                        yield recipe + b'\n'
+                return Response(generate(), mimetype='application/x-ndjson',
+                                headers={'X-Total-Count': str(total)})
+            return conditional_get(build)
+        
+        def build_page():
+            if not fields:
+                # whole recipes are kept encoded by the store, so the page is just joined together
+                recipes, total = store.query(offset=offset, limit=limit, encoded=True, **filters)
+                return fastjson.join_array(recipes), {'X-Total-Count': str(total)}
+            recipes, total = store.query(offset=offset, limit=limit, **filters)
+            return [project(recipe, fields) for recipe in recipes], {'X-Total-Count': str(total)}
+        return conditional_get(lambda version: cached_json(version, build_page))
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 # get single recipe by ID
 @app.route('/recipes/<int:recipe_id>', methods=['GET'])
 def get_recipe(recipe_id):
     """Get a single recipe by ID"""
     try:
-        recipes = load_recipes()
+        def build(version):
+            recipe = store.get(recipe_id, encoded=True)
+            if recipe is None:
+                return jsonify({"error": "Recipe not found"}), 404
+            return Response(recipe, mimetype='application/json')
         
-        # Find the recipe
-        for recipe in recipes:
-            if recipe['id'] == recipe_id:
-                return jsonify(recipe)
-        
-        return jsonify({"error": "Recipe not found"}), 404
+        return conditional_get(build)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -92,36 +321,16 @@ def add_recipe():
         data = request.get_json()
         
         # Basic validation
-        if not data.get('name'):
-            return jsonify({"error": "Recipe name is required"}), 400
-        
-        if not data.get('ingredients'):
-            return jsonify({"error": "Ingredients are required"}), 400
+        error = validate_recipe(data)
+        if error:
+            return jsonify({"error": error}), 400
         
-        # Load existing recipes
-        recipes = load_recipes()
+        # create new recipe, the store assigns the ID
+        new_recipe = store.add(recipe_fields(data))
+        prefetch_thumbnails([new_recipe])
         
-        # generate new ID
-        new_id = max([r['id'] for r in recipes], default=0) + 1
-        
-        # create new recipe
-        new_recipe = {
-            "id": new_id,
-            "name": data['name'],
-            "ingredients": data['ingredients'],
-            "instructions": data.get('instructions', ''),
-            "prep_time": data.get('prep_time', 0),
-            "difficulty": data.get('difficulty', 'Easy'),
-            "category": data.get('category', 'Main Course'),
-            "youtube_url": data.get('youtube_url', ''),
-            "is_favorite": data.get('is_favorite', False),
-            "created_at": datetime.now().strftime('%Y-%m-%d')
-        }
-        
-        recipes.append(new_recipe)
-        save_recipes(recipes)
-        
-        return jsonify(new_recipe), 201
+        # saved either way, the client decides what to do about a likely duplicate
+        return jsonify(dict(new_recipe.to_dict(), possible_duplicates=possible_duplicates(new_recipe))), 201
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -134,40 +343,111 @@ def edit_recipe(recipe_id):
         data = request.get_json()
         
         # basic validation
-        if not data.get('name'):
-            return jsonify({"error": "Recipe name is required"}), 400
-        
-        if not data.get('ingredients'):
-            return jsonify({"error": "Ingredients are required"}), 400
-        
-        # load existing recipes
-        recipes = load_recipes()
-        
-        # find and update the recipe
-        recipe_found = False
-        for i, recipe in enumerate(recipes):
-            if recipe['id'] == recipe_id:
-                # update the recipe while keeping original ID and created_at
-                recipes[i] = {
-                    "id": recipe_id,
-                    "name": data['name'],
-                    "ingredients": data['ingredients'],
-                    "instructions": data.get('instructions', ''),
-                    "prep_time": data.get('prep_time', 0),
-                    "difficulty": data.get('difficulty', 'Easy'),
-                    "category": data.get('category', 'Main Course'),
-                    "youtube_url": data.get('youtube_url', ''),
-                    "is_favorite": data.get('is_favorite', False),
-                    "created_at": recipe.get('created_at', datetime.now().strftime('%Y-%m-%d'))  # Keep original date
-                }
-                recipe_found = True
-                break
-        
-        if not recipe_found:
+        error = validate_recipe(data)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        # update the recipe while keeping original ID and created_at
+        updated = store.update(recipe_id, recipe_fields(data))
+        
+        if updated is None:
             return jsonify({"error": "Recipe not found"}), 404
+        prefetch_thumbnails([updated])
+        
+        return jsonify(updated.to_dict())  # Return updated recipe
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#bulk import
+@app.route('/recipes/bulk', methods=['POST'])
+def bulk_add_recipes():
+    """Add many recipes at once, sent as a JSON array or as NDJSON (one recipe per line)
+
+    Every recipe is checked first, the valid ones get consecutive IDs and are
+    saved in one go. Recipes that fail validation are listed in "errors".
+    """
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            items = []
+            lines = [line for line in request.stream if line.strip()]
+            with metrics.timer('recipe_json_seconds', op='parse'):
+                for line in lines:
+                    try:
+                        items.append(fastjson.loads(line))
+                    except ValueError:
+                        items.append(None)  # reported as an error below
+        else:
+            items = request.get_json()
+            if not isinstance(items, list):
+                return jsonify({"error": "Send a JSON array of recipes"}), 400
+        
+        valid = []
+        errors = []
+        for index, data in enumerate(items):
+            error = validate_recipe(data) if data is not None else "Invalid JSON"
+            if error:
+                errors.append({"index": index, "error": error})
+            else:
+                valid.append(recipe_fields(data))
+        
+        created = store.add_many(valid)
+        prefetch_thumbnails(created)
+        duplicates = []
+        for recipe in created:
+            similar = possible_duplicates(recipe)
+            if similar:
+                duplicates.append({"id": recipe.id, "possible_duplicates": similar})
+        status = 201 if created else 400
+        return jsonify({"created": len(created), "ids": [r.id for r in created], "errors": errors,
+                        "possible_duplicates": duplicates}), status
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#batch changes
+@app.route('/recipes/batch', methods=['POST'])
+def batch_recipes():
+    """Apply a list of update / delete / favorite operations and save them in one go
+
+    Each operation looks like {"op": "update", "id": 3, "recipe": {...}},
+    {"op": "delete", "id": 3} or {"op": "favorite", "id": 3}. Operations that
+    are invalid or point at a missing recipe are listed in "errors".
+    """
+    try:
+        data = request.get_json()
+        operations = data.get('operations') if isinstance(data, dict) else data
+        if not isinstance(operations, list):
+            return jsonify({"error": "Send a JSON array of operations"}), 400
+        
+        valid = []
+        indexes = []  # position in the request of each valid operation
+        errors = []
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or operation.get('op') not in ('update', 'delete', 'favorite'):
+                errors.append({"index": index, "error": "op must be update, delete or favorite"})
+                continue
+            if type(operation.get('id')) is not int:  # true would otherwise mean recipe 1
+                errors.append({"index": index, "error": "id must be a number"})
+                continue
+            if operation['op'] == 'update':
+                error = validate_recipe(operation.get('recipe'))
+                if error:
+                    errors.append({"index": index, "error": error})
+                    continue
+                valid.append(('update', operation['id'], recipe_fields(operation['recipe'])))
+            else:
+                valid.append((operation['op'], operation['id'], None))
+            indexes.append(index)
+        
+        results = store.apply_batch(valid)
+        prefetch_thumbnails(result for (op, _, _), result in zip(valid, results) if op == 'update' and result)
+        for index, result in zip(indexes, results):
+            if result is None:
+                errors.append({"index": index, "error": "Recipe not found"})
+        errors.sort(key=lambda error: error['index'])
         
-        save_recipes(recipes)
-        return jsonify(recipes[i])  # Return updated recipe
+        return jsonify({"applied": sum(result is not None for result in results), "errors": errors})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -177,24 +457,42 @@ def edit_recipe(recipe_id):
 def delete_recipe(recipe_id):
     """Delete a recipe"""
     try:
-        recipes = load_recipes()
-        
-        # find recipe to delete
-        recipe_to_delete = None
-        for i, recipe in enumerate(recipes):
-            if recipe['id'] == recipe_id:
-                recipe_to_delete = recipes.pop(i)
-                break
-        
-        if not recipe_to_delete:
+        if not store.delete(recipe_id):
             return jsonify({"error": "Recipe not found"}), 404
         
-        save_recipes(recipes)
         return jsonify({"message": "Recipe deleted successfully"})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+#recipe stats
+@app.route('/recipes/stats', methods=['GET'])
+def get_stats():
+    """Get the numbers shown in the UI's stats block"""
+    try:
+        return conditional_get(lambda version: jsonify(store.stats()))
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#export all recipes
+@app.route('/recipes/export', methods=['GET'])
+def export_recipes():
+    """Download every recipe as csv, ndjson or parquet, streamed in chunks"""
+    try:
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORTERS:
+            return jsonify({"error": f"format must be one of: {', '.join(EXPORTERS)}"}), 400
+        if export_format == 'parquet' and not parquet_available():
+            return jsonify({"error": "Parquet export needs pyarrow (pip install pyarrow)"}), 400
+        
+        mimetype, filename = FORMATS[export_format]
+        return Response(EXPORTERS[export_format](store.all()), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 #search recipe
 @app.route('/recipes/search', methods=['GET'])
 def search_recipes():
@@ -205,22 +503,160 @@ def search_recipes():
         if not query:
             return jsonify([])
         
-        recipes = load_recipes()
-        filtered_recipes = []
+        return conditional_get(lambda version: cached_json(
+            version, lambda: (fastjson.join_array(store.search(query, encoded=True)), {})))
         
-        for recipe in recipes:
-            # search in name
-            if query in recipe['name'].lower():
-                filtered_recipes.append(recipe)
-                continue
-            
-            # search in ingredients
-            for ingredient in recipe['ingredients']:
-                if query in ingredient.lower():
-                    filtered_recipes.append(recipe)
-                    break
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#autocomplete
+@app.route('/recipes/suggest', methods=['GET'])
+def suggest_recipes():
+    """Type-ahead: ids and names of recipes whose name or ingredient words start with prefix"""
+    try:
+        prefix = request.args.get('prefix', '')
+        limit = request.args.get('limit', SUGGEST_LIMIT, type=int)
+        if not 0 < limit <= MAX_SUGGEST_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {MAX_SUGGEST_LIMIT}"}), 400
+        
+        if not prefix.strip():
+            return jsonify([])
+        
+        return conditional_get(lambda version: cached_json(version, lambda: (store.suggest(prefix, limit), {})))
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#similar recipes
+@app.route('/recipes/<int:recipe_id>/similar', methods=['GET'])
+def similar_recipes(recipe_id):
+    """Recipes with mostly the same ingredients and name words, most similar first
+
+    Takes limit and min_similarity (0 to 1). Only fairly close recipes are
+    found, anything under about 0.4 similarity is unlikely to show up.
+    """
+    try:
+        limit = request.args.get('limit', SIMILAR_LIMIT, type=int)
+        if not 0 < limit <= MAX_SIMILAR_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {MAX_SIMILAR_LIMIT}"}), 400
+        min_similarity = request.args.get('min_similarity', 0.0, type=float)
+        if not 0 <= min_similarity <= 1:
+            return jsonify({"error": "min_similarity must be between 0 and 1"}), 400
         
-        return jsonify(filtered_recipes)
+        def build():
+            similar = store.similar(recipe_id, limit=limit, min_similarity=min_similarity) or []
+            return [{"recipe": match['recipe'].to_dict(), "similarity": round(match['similarity'], 3)}
+                    for match in similar], {}
+        
+        if store.get(recipe_id) is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        return conditional_get(lambda version: cached_json(version, build))
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#what can I cook
+@app.route('/recipes/match', methods=['POST'])
+def match_recipes():
+    """Rank recipes by how many of their ingredients are in a pantry
+
+    Body: {"ingredients": ["eggs", "pasta", ...], "rank_by": "coverage" or "missing",
+    "max_missing": 2, "limit": 20}. Only "ingredients" is required.
+    """
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "Send a JSON object with an ingredients list"}), 400
+        
+        pantry = data.get('ingredients')
+        if not pantry or not isinstance(pantry, list) or not all(isinstance(i, str) for i in pantry):
+            return jsonify({"error": "ingredients must be a non-empty list of text"}), 400
+        
+        rank_by = data.get('rank_by', 'coverage')
+        if rank_by not in ('coverage', 'missing'):
+            return jsonify({"error": "rank_by must be coverage or missing"}), 400
+        
+        max_missing = data.get('max_missing')
+        if max_missing is not None and (type(max_missing) is not int or max_missing < 0):
+            return jsonify({"error": "max_missing must be a whole number of at least 0"}), 400
+        
+        limit = data.get('limit', MATCH_LIMIT)
+        if type(limit) is not int or not 0 < limit <= MAX_MATCH_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {MAX_MATCH_LIMIT}"}), 400
+        
+        matches = store.match(pantry, rank_by=rank_by, max_missing=max_missing, limit=limit)
+        for match in matches:
+            match['recipe'] = match['recipe'].to_dict()
+        return jsonify(matches)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#video thumbnail
+@app.route('/thumbnails/<video_id>', methods=['GET'])
+def get_thumbnail(video_id):
+    """A YouTube video's thumbnail from the local cache, downloading it first if needed
+
+    Use a recipe's youtube_id. Comes back 404 if YouTube has no thumbnail for
+    it or it couldn't be fetched within THUMBNAIL_WAIT seconds.
+    """
+    try:
+        data = thumbnails.get(video_id, wait=THUMBNAIL_WAIT)
+        if data is None:
+            return jsonify({"error": "Thumbnail not available"}), 404
+        
+        response = Response(data, mimetype='image/jpeg')
+        response.add_etag()
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#change feed
+@app.route('/recipes/changes', methods=['GET'])
+def get_changes():
+    """Recipes added, edited or deleted since ?since=<version>, for clients keeping their own copy
+
+    The version to start from comes from any earlier reply here, or the ETag
+    of a GET /recipes.
+    """
+    try:
+        _, body = change_feed(parse_version(request.args.get('since')))
+        return Response(body, mimetype='application/json', headers={'Cache-Control': 'no-store'})
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#change feed as server-sent events
+@app.route('/recipes/changes/stream', methods=['GET'])
+def stream_changes():
+    """The change feed as an event stream, one "changes" event (same JSON as above) per batch
+
+    Starts from ?since= or the Last-Event-ID header a reconnecting EventSource sends.
+    """
+    try:
+        version = parse_version(request.args.get('since') or request.headers.get('Last-Event-ID'))
+        
+        def generate():
+            closes_at = time.monotonic() + CHANGE_STREAM_SECONDS
+            quiet_since = time.monotonic()
+            current = version
+            yield b'retry: 1000\n\n'
+            while time.monotonic() < closes_at:
+                latest, body = change_feed(current)
+                if latest != current:
+                    current = latest
+                    quiet_since = time.monotonic()
+                    yield b'id: %s-%d\nevent: changes\ndata: %s\n\n' % (INSTANCE_TAG.encode(), current, body)
+                elif time.monotonic() - quiet_since >= KEEPALIVE_SECONDS:
+                    quiet_since = time.monotonic()
+                    yield b': keep-alive\n\n'
+                store.wait_for_change(current, CHANGE_POLL_SECONDS)
+                yield b''  # sends nothing, but lets asgi.py stop here if the client went away
+        
+        return Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -230,27 +666,32 @@ def search_recipes():
 def toggle_favorite(recipe_id):
     """Toggle favorite status of a recipe"""
     try:
-        recipes = load_recipes()
-        
-        # find recipe to update
-        recipe_found = False
-        for recipe in recipes:
-            if recipe['id'] == recipe_id:
-                recipe['is_favorite'] = not recipe.get('is_favorite', False)
-                recipe_found = True
-                break
-        
-        if not recipe_found:
+        if store.toggle_favorite(recipe_id) is None:
             return jsonify({"error": "Recipe not found"}), 404
         
-        save_recipes(recipes)
         return jsonify({"message": "Favorite status updated"})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+#metrics for prometheus
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, storage and JSON timings in the Prometheus text format"""
+    try:
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 #server setup
 if __name__ == '__main__':
     print("Starting Recipe Manager API...")
     print("Visit: http://localhost:5000")
-    app.run(debug=True, port=5000)
+    # the reloader runs this file twice, only the process serving requests needs the recipes
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_up()
+    try:
+        app.run(debug=True, port=5000)
+    finally:
+        shut_down()
@@ -0,0 +1,204 @@
+"""Production entry point: serves app.py's routes as an ASGI app under uvicorn
+
+    python asgi.py                      # or: uvicorn asgi:application --workers 4
+
+The Flask app itself is unchanged (so the test client works the same). Each
+request is handed to it on a thread pool, so blocking storage reads and
+writes never hold up the event loop, and streamed responses (exports,
+ndjson) are sent chunk by chunk as the pool produces them.
+
+Settings, all from the environment:
+    RECIPE_HOST / RECIPE_PORT   where to listen (default 127.0.0.1:5000)
+    RECIPE_WORKERS              uvicorn worker processes (default 1), each with
+                                its own store on the same files
+    RECIPE_THREADS              threads per worker for running requests (default 32)
+    RECIPE_STREAMS              how many /recipes/changes/stream connections a worker
+                                holds open at once (default 256), each on its own
+                                thread outside the request pool
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, shut_down, start_up
+
+HOST = os.environ.get('RECIPE_HOST', '127.0.0.1')
+PORT = int(os.environ.get('RECIPE_PORT', '5000'))
+WORKERS = int(os.environ.get('RECIPE_WORKERS', '1'))
+THREADS = int(os.environ.get('RECIPE_THREADS', '32'))
+STREAMS = int(os.environ.get('RECIPE_STREAMS', '256'))
+
+# responses that stay open for minutes, run on their own pool so they can't use up THREADS
+STREAM_PATHS = ('/recipes/changes/stream',)
+
+
+class _ClientGone(Exception):
+    pass
+
+
+class WsgiToAsgi:
+    """Runs a WSGI app for ASGI servers, one pool thread per request
+
+    While a response is being sent the client's connection is watched, and
+    once it goes away the app's iterable is closed at its next chunk. Apps
+    with responses that wait a long time between chunks should yield b''
+    every so often, so that happens soon after the client leaves.
+    """
+
+    def __init__(self, wsgi_app, threads=THREADS, multiprocess=WORKERS > 1, on_startup=None, on_shutdown=None,
+                 stream_paths=STREAM_PATHS, streams=STREAMS):
+        self.wsgi_app = wsgi_app
+        # blocking functions run on their own thread before the first request and after the last
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+        self.stream_paths = stream_paths
+        self.stream_executor = ThreadPoolExecutor(streams, thread_name_prefix='wsgi-stream')
+        self.multiprocess = multiprocess
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.on_startup:
+                    await asyncio.to_thread(self.on_startup)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.on_shutdown:
+                    await asyncio.to_thread(self.on_shutdown)
+                self.executor.shutdown(wait=False)
+                self.stream_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        environ = self._environ(scope, bytes(body))
+        executor = self.stream_executor if environ['PATH_INFO'] in self.stream_paths else self.executor
+        gone = threading.Event()
+        watcher = asyncio.ensure_future(self._watch(receive, gone))
+        try:
+            await loop.run_in_executor(executor, self._run, environ, send, loop, gone)
+        finally:
+            watcher.cancel()
+
+    async def _watch(self, receive, gone):
+        """Set gone when the client disconnects, servers don't tell us any other way"""
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        gone.set()
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        # WSGI wants the raw path bytes as a latin-1 string
+        path = scope.get('raw_path') or scope['path'].encode('utf-8')
+        path = path.split(b'?', 1)[0].decode('latin-1')
+        root_path = scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path,
+            'PATH_INFO': path,
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': self.multiprocess,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = 'HTTP_' + name
+                environ[key] = environ[key] + ',' + value if key in environ else value
+        return environ
+
+    def _run(self, environ, send, loop, gone):
+        """Run the WSGI app on a pool thread, passing each chunk to the event loop as it comes"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        def send_now(message):
+            if gone.is_set():
+                raise _ClientGone()
+            # waiting for each send means a slow client slows the generator down
+            # instead of the response piling up in memory
+            try:
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+            except Exception as e:
+                raise _ClientGone() from e
+
+        def start():
+            if not response.get('started'):
+                response['started'] = True
+                send_now({'type': 'http.response.start', 'status': response['status'],
+                          'headers': response['headers']})
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if gone.is_set():
+                    raise _ClientGone()
+                if chunk:
+                    start()
+                    send_now({'type': 'http.response.body', 'body': bytes(chunk), 'more_body': True})
+            start()
+            send_now({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except _ClientGone:
+            pass
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+
+# each worker loads the recipes (from the snapshot when there is one) before it takes requests
+application = WsgiToAsgi(app, on_startup=start_up, on_shutdown=shut_down)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("asgi.py needs uvicorn (pip install uvicorn), or use any other ASGI server on asgi:application")
+    print(f"Starting Recipe Manager API with {WORKERS} worker(s) x {THREADS} threads...")
+    print(f"Visit: http://{HOST}:{PORT}")
+    uvicorn.run('asgi:application', host=HOST, port=PORT, workers=WORKERS, access_log=False)
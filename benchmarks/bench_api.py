@@ -0,0 +1,301 @@
+"""Drive every API route under concurrent load and save the numbers as JSON
+
+Usage: python benchmarks/bench_api.py [--sizes 1000,10000,100000,1000000]
+                                      [--mode client|server|both] [--concurrency 8]
+                                      [--requests 200] [--writes 20]
+                                      [--journal | --storage sqlite]
+                                      [--output results.json] [--compare old.json]
+
+Datasets are generated once with a fixed seed and kept in benchmarks/data.
+Each size runs in its own process, so peak RSS is that size's alone.
+"client" goes through Flask's test client, "server" through a real threaded
+WSGI server over HTTP. Every route reports throughput and p50/p99 latency.
+Run it on two commits and pass the first file to --compare to see the change.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import ROOT, make_recipe, write_dataset
+from migrate import migrate
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def dataset_path(size):
+    """Return the cached dataset of this size, generating it the first time"""
+    path = os.path.join(DATA_DIR, f'recipes-{size}.json')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        write_dataset(path + '.tmp', size)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def new_recipe(rng):
+    recipe = make_recipe(0, rng)
+    del recipe['id'], recipe['created_at']
+    return recipe
+
+
+def routes(size, args):
+    """Return (name, count, make_request) for every route
+
+    make_request(rng, n) returns (method, path, json body or None) for the
+    n-th request of that route. Whole-collection routes get fewer requests
+    so big sizes finish in reasonable time.
+    """
+    reads, writes = args.requests, args.writes
+    heavy = max(3, reads // 20)
+    # deletes take ids from the top, the other writes stay below them
+    deletable = size - writes
+
+    def random_id(rng):
+        return rng.randint(1, max(1, deletable))
+
+    return [
+        ('home', reads, lambda rng, n: ('GET', '/', None)),
+        ('list page', reads, lambda rng, n: ('GET', f'/recipes?limit=20&offset={rng.randint(0, size - 20)}', None)),
+        ('list filtered', reads, lambda rng, n: ('GET', '/recipes?category=Dessert&sort=-prep_time&limit=20', None)),
+        ('list all', heavy, lambda rng, n: ('GET', '/recipes', None)),
+        ('list ndjson', heavy, lambda rng, n: ('GET', '/recipes?format=ndjson', None)),
+        ('get one', reads, lambda rng, n: ('GET', f'/recipes/{random_id(rng)}', None)),
+        ('search', reads, lambda rng, n: ('GET', f'/recipes/search?q={rng.choice(["tom", "chicken rice", "gar"])}', None)),
+        ('suggest', reads, lambda rng, n: ('GET', f'/recipes/suggest?prefix={rng.choice(["c", "ch", "tomato g"])}', None)),
+        ('stats', reads, lambda rng, n: ('GET', '/recipes/stats', None)),
+        ('export csv', heavy, lambda rng, n: ('GET', '/recipes/export?format=csv', None)),
+        ('metrics', reads, lambda rng, n: ('GET', '/metrics', None)),
+        ('add', writes, lambda rng, n: ('POST', '/recipes', new_recipe(rng))),
+        ('edit', writes, lambda rng, n: ('PUT', f'/recipes/{random_id(rng)}', new_recipe(rng))),
+        ('favorite', writes, lambda rng, n: ('PUT', f'/recipes/{random_id(rng)}/favorite', None)),
+        ('bulk add 10', writes, lambda rng, n: ('POST', '/recipes/bulk', [new_recipe(rng) for _ in range(10)])),
+        ('batch 10', writes, lambda rng, n: ('POST', '/recipes/batch',
+                                             [{'op': 'favorite', 'id': random_id(rng)} for _ in range(10)])),
+        ('delete', writes, lambda rng, n: ('DELETE', f'/recipes/{size - n}', None)),
+    ]
+
+
+def test_client_sender(app):
+    local = threading.local()
+
+    def send(method, path, body):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.open(path, method=method, json=body)
+        response.get_data()  # make streamed responses actually run
+        return response.status_code
+    return send, lambda: None
+
+
+def server_sender(app):
+    import requests
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no line per request
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    local = threading.local()
+
+    def send(method, path, body):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        response = local.session.request(method, base_url + path, json=body)
+        return response.status_code
+    return send, server.shutdown
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def load_route(send, make_request, count, concurrency, seed):
+    """Send count requests from concurrency threads, returning the route's numbers"""
+    counter = iter(range(count))
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            method, path, body = make_request(rng, n)
+            start = time.perf_counter()
+            status = send(method, path, body)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors.append(status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': count,
+        'errors': len(errors),
+        'throughput': round(count / wall, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def open_store(source, tmp, name, args):
+    """Copy the dataset into tmp under name and open a store on it"""
+    from storage import JsonFileBackend, SqliteBackend
+    from store import RecipeStore
+
+    if args.storage == 'sqlite':
+        db_path = os.path.join(tmp, name + '.db')
+        migrate(source, db_path)
+        return RecipeStore(SqliteBackend(db_path))
+    json_path = os.path.join(tmp, name + '.json')
+    shutil.copy(source, json_path)
+    # no background compaction, it would outlive the temp folder
+    return RecipeStore(JsonFileBackend(json_path, journal=args.journal, compact_every=10 ** 9))
+
+
+def run_size(size, args):
+    """Benchmark one dataset size in this process and return its results"""
+    source = dataset_path(size)
+    tmp = tempfile.mkdtemp(prefix='recipe-bench-')
+    try:
+        # importing app creates its store in the working directory, keep that out of the repo
+        os.chdir(tmp)
+        import app as app_module
+        from cache import ResponseCache
+
+        results = []
+        load_seconds = None
+        for mode in (['client', 'server'] if args.mode == 'both' else [args.mode]):
+            # every mode starts from its own fresh copy of the data
+            start = time.perf_counter()
+            store = open_store(source, tmp, mode, args)
+            store.version_info()  # loads everything
+            if load_seconds is None:
+                load_seconds = time.perf_counter() - start
+            app_module.store = store
+            app_module.response_cache = ResponseCache()
+
+            sender = test_client_sender if mode == 'client' else server_sender
+            send, stop = sender(app_module.app)
+            try:
+                for seed, (name, count, make_request) in enumerate(routes(size, args)):
+                    numbers = load_route(send, make_request, count, args.concurrency, seed)
+                    results.append(dict(size=size, mode=mode, route=name, **numbers))
+                    print(f"  {size:>8} {mode:<6} {name:<14} {numbers['throughput']:>10.1f} req/s"
+                          f"  p50 {numbers['p50_ms']:>9.3f} ms  p99 {numbers['p99_ms']:>9.3f} ms"
+                          + (f"  ({numbers['errors']} errors)" if numbers['errors'] else ''),
+                          file=sys.stderr)
+            finally:
+                stop()
+
+        return {'size': size, 'load_seconds': round(load_seconds, 3), 'peak_rss_mb': peak_rss_mb(),
+                'results': results}
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """Print throughput and p99 changes between two result files"""
+    before = {(r['size'], r['mode'], r['route']): r for size in old['sizes'] for r in size['results']}
+    print(f"\n{old.get('commit')} -> {new.get('commit')}")
+    for size in new['sizes']:
+        for result in size['results']:
+            previous = before.get((result['size'], result['mode'], result['route']))
+            if previous is None:
+                continue
+            speedup = result['throughput'] / previous['throughput'] if previous['throughput'] else float('inf')
+            print(f"  {result['size']:>8} {result['mode']:<6} {result['route']:<14} "
+                  f"throughput {speedup:6.2f}x  p99 {previous['p99_ms']:>9.3f} -> {result['p99_ms']:>9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000',
+                        help="comma separated recipe counts, e.g. 1000,10000,100000,1000000")
+    parser.add_argument('--mode', choices=['client', 'server', 'both'], default='both')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="requests per read route")
+    parser.add_argument('--writes', type=int, default=20, help="requests per write route")
+    parser.add_argument('--journal', action='store_true', help="use journal mode")
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--output', help="where to save the results (default bench-<commit>.json)")
+    parser.add_argument('--compare', help="an earlier results file to compare against")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    if args.child:
+        # one size, results go to the parent on stdout
+        json.dump(run_size(sizes[0], args), sys.stdout)
+        return
+
+    results = []
+    for size in sizes:
+        dataset_path(size)
+        command = [sys.executable, os.path.abspath(__file__), '--child', '--sizes', str(size),
+                   '--mode', args.mode, '--concurrency', str(args.concurrency),
+                   '--requests', str(args.requests), '--writes', str(args.writes), '--storage', args.storage]
+        if args.journal:
+            command.append('--journal')
+        child = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+        result = json.loads(child.stdout)
+        print(f"  {size:>8} recipes: loaded in {result['load_seconds']} s, peak RSS {result['peak_rss_mb']} MB",
+              file=sys.stderr)
+        results.append(result)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'mode': args.mode, 'concurrency': args.concurrency, 'requests': args.requests,
+                     'writes': args.writes, 'storage': args.storage, 'journal': args.journal},
+        'sizes': results,
+    }
+    output = args.output or f"bench-{report['commit'] or 'results'}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
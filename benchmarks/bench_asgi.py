@@ -0,0 +1,134 @@
+"""Load test: how app.run and asgi.py scale with the number of concurrent clients
+
+Usage: python benchmarks/bench_asgi.py [--recipes 10000] [--workers 1,2,4]
+                                       [--concurrency 1,4,16,64] [--requests 2000]
+                                       [--write-ratio 0.02] [--journal] [--output results.json]
+
+Each server runs in its own process on a copy of the same dataset, and is
+sent a mix of list / get / search / suggest / stats requests plus a few
+favorite toggles from N client threads at once. "app.run" is the dev server
+`python app.py` starts (without the reloader, which only adds a parent
+process); "asgi xN" is `python asgi.py` with RECIPE_WORKERS=N. Needs uvicorn.
+Workers share the data files, so with several of them a write makes the
+others reload; --journal turns that into reading just the new log lines.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from bench_api import dataset_path, load_route
+from common import ROOT
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, workers, folder, port, journal):
+    """Start a server process serving folder/recipes.json and wait until it answers"""
+    env = dict(os.environ, PYTHONPATH=ROOT, RECIPE_PORT=str(port), RECIPE_WORKERS=str(workers),
+               RECIPE_JOURNAL='1' if journal else '0')
+    if kind == 'app.run':
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(debug=True, use_reloader=False, port={port})"]
+    else:
+        command = [sys.executable, os.path.join(ROOT, 'asgi.py')]
+    process = subprocess.Popen(command, cwd=folder, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} exited with status {process.returncode}")
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} didn't start")
+
+
+def request_mix(size, write_ratio):
+    def make_request(rng, n):
+        if rng.random() < write_ratio:
+            return 'PUT', f'/recipes/{rng.randint(1, size)}/favorite', None
+        return rng.choice([
+            ('GET', f'/recipes?limit=20&offset={rng.randint(0, size - 20)}', None),
+            ('GET', f'/recipes/{rng.randint(1, size)}', None),
+            ('GET', f'/recipes/search?q={rng.choice(["tom", "chicken rice", "gar"])}', None),
+            ('GET', f'/recipes/suggest?prefix={rng.choice(["c", "ch", "tomato g"])}', None),
+            ('GET', '/recipes/stats', None),
+        ])
+    return make_request
+
+
+def http_sender(port):
+    local = threading.local()
+    base_url = f'http://127.0.0.1:{port}'
+
+    def send(method, path, body):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session.request(method, base_url + path, json=body).status_code
+    return send
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=10000)
+    parser.add_argument('--workers', default='1,2,4', help="asgi.py worker counts to try")
+    parser.add_argument('--concurrency', default='1,4,16,64', help="client thread counts to try")
+    parser.add_argument('--requests', type=int, default=2000, help="requests per run")
+    parser.add_argument('--write-ratio', type=float, default=0.02)
+    parser.add_argument('--journal', action='store_true', help="use journal mode")
+    parser.add_argument('--output', help="save the results as JSON here")
+    args = parser.parse_args()
+
+    servers = [('app.run', 1)] + [('asgi', int(n)) for n in args.workers.split(',')]
+    levels = [int(n) for n in args.concurrency.split(',')]
+    source = dataset_path(args.recipes)
+    make_request = request_mix(args.recipes, args.write_ratio)
+
+    results = []
+    print(f"{args.recipes} recipes, {args.requests} requests per run")
+    print(f"  {'server':<10} {'clients':>7} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for kind, workers in servers:
+        name = kind if kind == 'app.run' else f'asgi x{workers}'
+        folder = tempfile.mkdtemp(prefix='recipe-asgi-')
+        shutil.copy(source, os.path.join(folder, 'recipes.json'))
+        port = free_port()
+        process = start_server(kind, workers, folder, port, args.journal)
+        try:
+            send = http_sender(port)
+            load_route(send, make_request, 200, 4, seed=0)  # warm up every worker
+            for level in levels:
+                numbers = load_route(send, make_request, args.requests, level, seed=level)
+                results.append(dict(server=name, clients=level, **numbers))
+                print(f"  {name:<10} {level:>7} {numbers['throughput']:>10.1f} {numbers['p50_ms']:>9.2f}"
+                      f" {numbers['p99_ms']:>9.2f}" + (f"  ({numbers['errors']} errors)" if numbers['errors'] else ''))
+        finally:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(folder, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'recipes': args.recipes, 'requests': args.requests, 'write_ratio': args.write_ratio,
+                       'journal': args.journal, 'cpus': os.cpu_count(),
+                       'results': results}, f, indent=2)
+        print(f"saved {args.output}")
+
+
+if __name__ == '__main__':
+    main()
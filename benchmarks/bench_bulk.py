@@ -0,0 +1,65 @@
+"""Compare importing recipes one POST at a time against one POST /recipes/bulk
+
+Usage: python benchmarks/bench_bulk.py [--recipes 2000] [--journal | --storage sqlite]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import make_recipe
+from storage import JsonFileBackend, SqliteBackend
+from store import RecipeStore
+
+
+def fresh_store(tmp, args):
+    if args.storage == 'sqlite':
+        return RecipeStore(SqliteBackend(os.path.join(tmp, 'recipes.db')))
+    # no background compaction, it would outlive the temp folder
+    backend = JsonFileBackend(os.path.join(tmp, 'recipes.json'), journal=args.journal, compact_every=10 ** 9)
+    return RecipeStore(backend)
+
+
+def run(bulk, payload, args):
+    """Import payload through the Flask test client and return recipes per second"""
+    import app as app_module
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.store = fresh_store(tmp, args)
+        client = app_module.app.test_client()
+
+        start = time.perf_counter()
+        if bulk:
+            response = client.post('/recipes/bulk', json=payload)
+            assert response.get_json()['created'] == len(payload)
+        else:
+            for recipe in payload:
+                assert client.post('/recipes', json=recipe).status_code == 201
+        elapsed = time.perf_counter() - start
+        return len(payload) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=2000)
+    parser.add_argument('--journal', action='store_true', help="use journal mode")
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payload = []
+    for i in range(args.recipes):
+        recipe = make_recipe(i, rng)
+        del recipe['id'], recipe['created_at']
+        payload.append(recipe)
+
+    one_by_one = run(False, payload, args)
+    bulk = run(True, payload, args)
+    print(f"importing {args.recipes} recipes")
+    print(f"  one POST each:     {one_by_one:10.1f} recipes/s")
+    print(f"  POST /recipes/bulk {bulk:10.1f} recipes/s  ({bulk / one_by_one:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
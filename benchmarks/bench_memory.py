@@ -0,0 +1,49 @@
+"""Compare the memory of recipes held as plain dicts against models.Recipe
+
+Usage: python benchmarks/bench_memory.py [--recipes 100000]
+
+Recipes are decoded from JSON like the store loads them, so every string
+starts out as its own object, then kept either as the decoded dicts or
+converted to Recipe objects.
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+from common import make_recipe
+import fastjson
+from models import Recipe
+
+
+def measure(build, data):
+    """Return how many bytes what build(data) returns keeps alive"""
+    gc.collect()
+    tracemalloc.start()
+    result = build(data)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    data = fastjson.dumps([make_recipe(i, rng) for i in range(1, args.recipes + 1)])
+
+    as_dicts = measure(fastjson.loads, data)
+    as_recipes = measure(lambda data: [Recipe.from_dict(recipe) for recipe in fastjson.loads(data)], data)
+
+    print(f"{args.recipes} recipes in memory")
+    print(f"  dicts:  {as_dicts / 2 ** 20:8.1f} MB  ({as_dicts / args.recipes:6.0f} bytes each)")
+    print(f"  Recipe: {as_recipes / 2 ** 20:8.1f} MB  ({as_recipes / args.recipes:6.0f} bytes each, "
+          f"{as_recipes / as_dicts:.0%} of the dicts)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Startup time: how long until the API and the UI's first page answer after a (re)start
+
+Usage: python benchmarks/bench_startup.py [--sizes 10000,100000] [--journal] [--output results.json]
+
+For each dataset size the API (`python asgi.py`) is started twice on a copy
+of the same recipes.json: a cold start that parses every recipe and builds
+the indexes, then a warm start from the snapshot the first one saved when
+it was stopped. Reported per run is the time from launching the process to
+the first answered GET /recipes, and for the cold run how long stopping took
+(that's when the snapshot is written). `import app` is timed on its own, as
+is importing what ui.py needs besides streamlit and fetching what its first
+page shows (one page of summaries and the stats) from the warm server.
+Needs uvicorn.
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from bench_api import dataset_path
+from bench_asgi import free_port
+from common import ROOT
+
+
+def time_import(code, folder):
+    """Run code in a fresh interpreter and return how long it took, in seconds"""
+    script = f"import sys, time; start = time.perf_counter(); {code}; print(time.perf_counter() - start)"
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=folder,
+                                     env=dict(os.environ, PYTHONPATH=ROOT))
+    return float(output.decode().split()[-1])
+
+
+def start_api(folder, port, journal):
+    """Start asgi.py and return (process, seconds until GET /recipes answered)"""
+    env = dict(os.environ, PYTHONPATH=ROOT, RECIPE_PORT=str(port), RECIPE_WORKERS='1',
+               RECIPE_JOURNAL='1' if journal else '0')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'asgi.py')], cwd=folder, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = start + 600
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"asgi.py exited with status {process.returncode}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/recipes?limit=1', timeout=600).status_code == 200:
+                return process, time.perf_counter() - start
+        except requests.ConnectionError:
+            time.sleep(0.02)
+    process.kill()
+    raise RuntimeError("asgi.py didn't start")
+
+
+def stop_api(process):
+    """Stop the server the way a deploy would and return how long it took to exit"""
+    start = time.perf_counter()
+    process.send_signal(signal.SIGINT)
+    process.wait()
+    return time.perf_counter() - start
+
+
+def first_page(port):
+    """Seconds for the requests ui.py makes to show its first page"""
+    sys.path.insert(0, ROOT)
+    from api_client import RecipeClient
+
+    client = RecipeClient(f'http://127.0.0.1:{port}')
+    start = time.perf_counter()
+    client.list_page(0, 20, ['name', 'difficulty', 'prep_time', 'category', 'is_favorite'])
+    client.get_stats()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--journal', action='store_true', help="use journal mode")
+    parser.add_argument('--output', help="save the results as JSON here")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='recipe-startup-')
+    try:
+        import_app = time_import('import app', folder)
+        import_ui = time_import('import api_client, youtube', folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print(f"import app: {import_app * 1000:.0f} ms, ui.py's own imports: {import_ui * 1000:.0f} ms")
+
+    results = []
+    print(f"  {'recipes':>8} {'cold s':>8} {'stop s':>8} {'warm s':>8} {'snapshot MB':>12} {'ui page ms':>11}")
+    for size in [int(n) for n in args.sizes.split(',')]:
+        folder = tempfile.mkdtemp(prefix='recipe-startup-')
+        shutil.copy(dataset_path(size), os.path.join(folder, 'recipes.json'))
+        port = free_port()
+        try:
+            process, cold = start_api(folder, port, args.journal)
+            stop = stop_api(process)
+            snapshot_mb = os.path.getsize(os.path.join(folder, 'recipes.snapshot')) / 2 ** 20
+            process, warm = start_api(folder, port, args.journal)
+            try:
+                page = first_page(port)
+            finally:
+                stop_api(process)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+        results.append({'recipes': size, 'cold_seconds': cold, 'stop_seconds': stop, 'warm_seconds': warm,
+                        'snapshot_mb': snapshot_mb, 'ui_first_page_ms': page * 1000})
+        print(f"  {size:>8} {cold:>8.2f} {stop:>8.2f} {warm:>8.2f} {snapshot_mb:>12.1f} {page * 1000:>11.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'journal': args.journal, 'import_app_seconds': import_app, 'import_ui_seconds': import_ui,
+                       'cpus': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"saved {args.output}")
+
+
+if __name__ == '__main__':
+    main()
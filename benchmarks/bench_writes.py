@@ -0,0 +1,52 @@
+"""Compare write throughput of full-file rewrites against journal mode and SQLite
+
+Usage: python benchmarks/bench_writes.py [--recipes 10000] [--writes 200]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import write_dataset
+from migrate import migrate
+from storage import JsonFileBackend, SqliteBackend
+from store import RecipeStore
+
+
+def run(kind, recipes, writes):
+    """Toggle favorites `writes` times and return writes per second"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'recipes.json')
+        write_dataset(path, recipes)
+        if kind == 'sqlite':
+            migrate(path, os.path.join(tmp, 'recipes.db'))
+            backend = SqliteBackend(os.path.join(tmp, 'recipes.db'))
+        else:
+            backend = JsonFileBackend(path, journal=kind == 'journal', compact_every=writes * 2)
+        store = RecipeStore(backend)
+        store.all()  # load before timing
+
+        start = time.perf_counter()
+        for i in range(writes):
+            store.toggle_favorite(i % recipes + 1)
+        elapsed = time.perf_counter() - start
+        return writes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=10000)
+    parser.add_argument('--writes', type=int, default=200)
+    args = parser.parse_args()
+
+    rewrite = run('rewrite', args.recipes, args.writes)
+    journal = run('journal', args.recipes, args.writes)
+    sqlite = run('sqlite', args.recipes, args.writes)
+    print(f"{args.recipes} recipes, {args.writes} favorite toggles")
+    print(f"  rewrite whole file: {rewrite:10.1f} writes/s")
+    print(f"  journal (fsynced):  {journal:10.1f} writes/s  ({journal / rewrite:.1f}x)")
+    print(f"  sqlite (WAL):       {sqlite:10.1f} writes/s  ({sqlite / rewrite:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
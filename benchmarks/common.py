@@ -0,0 +1,44 @@
+"""Helpers shared by the benchmark scripts"""
+import json
+import os
+import random
+import sys
+
+# let the scripts import app.py and store.py from the project folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+INGREDIENTS = [
+    "pasta", "eggs", "bacon", "cheese", "pepper", "flour", "butter", "sugar",
+    "chocolate chips", "salt", "onion", "garlic", "tomato", "paneer", "ginger",
+    "cumin seeds", "coriander powder", "rice", "chicken", "milk", "cream", "oil",
+]
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+CATEGORIES = ["Main Course", "Dessert", "Appetizer", "Breakfast", "Snack", "Beverage"]
+
+
+def make_recipe(recipe_id, rng=random):
+    """Build one fake recipe that looks like the real ones"""
+    ingredients = rng.sample(INGREDIENTS, rng.randint(3, 10))
+    return {
+        "id": recipe_id,
+        "name": f"{ingredients[0].title()} {rng.choice(['Curry', 'Bake', 'Soup', 'Salad', 'Stew'])} {recipe_id}",
+        "ingredients": ingredients,
+        "instructions": "Mix everything together. " * rng.randint(1, 20),
+        "prep_time": rng.randint(5, 120),
+        "difficulty": rng.choice(DIFFICULTIES),
+        "category": rng.choice(CATEGORIES),
+        "youtube_url": "",
+        "is_favorite": rng.random() < 0.2,
+        "created_at": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+    }
+
+
+def write_dataset(path, count, seed=42):
+    """Write a recipes.json with `count` fake recipes"""
+    rng = random.Random(seed)
+    recipes = [make_recipe(i, rng) for i in range(1, count + 1)]
+    with open(path, 'w') as f:
+        json.dump(recipes, f, indent=2)
+    return recipes
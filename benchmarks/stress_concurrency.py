@@ -0,0 +1,130 @@
+"""Hammer the store from many threads and processes and check no update is lost
+
+Usage: python benchmarks/stress_concurrency.py [--adds 2000] [--toggles 1001]
+                                               [--journal | --storage sqlite]
+
+Threads go through the Flask test client, processes each open their own
+RecipeStore on the same files like separate gunicorn workers would.
+Exits with status 1 if any add or toggle went missing.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import write_dataset
+from migrate import migrate
+from storage import JsonFileBackend, SqliteBackend
+from store import RecipeStore
+
+FAVORITE_ID = 1
+
+
+def open_store(path, args):
+    if args.storage == 'sqlite':
+        return RecipeStore(SqliteBackend(path))
+    return RecipeStore(JsonFileBackend(path, journal=args.journal))
+
+
+def make_dataset(tmp, args):
+    """Write 100 recipes in the chosen storage and return (path, recipes)"""
+    json_path = os.path.join(tmp, 'recipes.json')
+    initial = write_dataset(json_path, 100)
+    if args.storage == 'sqlite':
+        db_path = os.path.join(tmp, 'recipes.db')
+        migrate(json_path, db_path)
+        return db_path, initial
+    return json_path, initial
+
+
+def add_and_toggle(path, args, adds, toggles):
+    """Worker process: add recipes and flip the favorite on recipe 1"""
+    store = open_store(path, args)
+    ids = [store.add({"name": f"stress {os.getpid()} {i}", "ingredients": ["salt"]})['id']
+           for i in range(adds)]
+    for _ in range(toggles):
+        store.toggle_favorite(FAVORITE_ID)
+    return ids
+
+
+def check(path, args, initial, expected_ids, toggles, label, elapsed):
+    """Reload the data from scratch and compare against what the workers did"""
+    recipes = open_store(path, args).all()
+    ids = [r['id'] for r in recipes]
+    favorite = next(r for r in recipes if r['id'] == FAVORITE_ID)['is_favorite']
+    expected_favorite = initial[FAVORITE_ID - 1]['is_favorite'] != (toggles % 2 == 1)
+
+    problems = []
+    if len(expected_ids) != len(set(expected_ids)):
+        problems.append("the same id was handed out twice")
+    if len(ids) != len(initial) + len(expected_ids) or not set(expected_ids) <= set(ids):
+        problems.append(f"expected {len(initial) + len(expected_ids)} recipes, found {len(ids)}")
+    if favorite != expected_favorite:
+        problems.append("a favorite toggle was lost")
+
+    status = "FAIL: " + "; ".join(problems) if problems else "ok"
+    print(f"{label:10} {len(expected_ids)} adds, {toggles} toggles in {elapsed:.2f}s - {status}")
+    return not problems
+
+
+def run_threads(args):
+    import app as app_module
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, initial = make_dataset(tmp, args)
+        app_module.store = open_store(path, args)
+        app_module.app.config['TESTING'] = True
+
+        def add(i):
+            client = app_module.app.test_client()
+            response = client.post('/recipes', json={"name": f"stress {i}", "ingredients": ["salt"]})
+            return response.get_json()['id']
+
+        def toggle(_):
+            client = app_module.app.test_client()
+            assert client.put(f'/recipes/{FAVORITE_ID}/favorite').status_code == 200
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            toggled = pool.map(toggle, range(args.toggles))
+            ids = list(pool.map(add, range(args.adds)))
+            list(toggled)
+        elapsed = time.perf_counter() - start
+        return check(path, args, initial, ids, args.toggles, "threads", elapsed)
+
+
+def run_processes(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path, initial = make_dataset(tmp, args)
+        per_process = args.adds // args.processes
+        toggles = args.toggles // args.processes
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.starmap(add_and_toggle,
+                                   [(path, args, per_process, toggles)] * args.processes)
+        elapsed = time.perf_counter() - start
+        ids = [i for result in results for i in result]
+        return check(path, args, initial, ids, toggles * args.processes, "processes", elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--adds', type=int, default=2000)
+    parser.add_argument('--toggles', type=int, default=1001)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--journal', action='store_true', help="use journal mode")
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    args = parser.parse_args()
+
+    ok = run_threads(args)
+    ok = run_processes(args) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Small LRU cache of serialized responses, tagged with the store version they came from
+
+    Entries from an older version are never served, the whole cache is
+    dropped as soon as a newer version is seen.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """Return the cached value for key, or None if missing or out of date"""
+        with self._lock:
+            self._check_version(version)
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, version, value):
+        """Remember a value built from the given store version"""
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return  # built from data that has changed since
+            self._check_version(version)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
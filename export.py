@@ -0,0 +1,137 @@
+"""Streaming exports for GET /recipes/export
+
+Each exporter is a generator that yields the file a chunk at a time, so
+the whole export never sits in memory as one string.
+"""
+import csv
+import importlib.util
+import io
+
+import fastjson
+from metrics import metrics
+
+CHUNK_SIZE = 1000
+
+# same columns the UI used to build with pandas
+CSV_COLUMNS = ['Name', 'Category', 'Ingredients', 'Instructions', 'Prep Time (min)',
+               'Difficulty', 'YouTube URL', 'Favorite', 'Created']
+
+FORMATS = {
+    'csv': ('text/csv', 'my_recipes.csv'),
+    'ndjson': ('application/x-ndjson', 'my_recipes.ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'my_recipes.parquet'),
+}
+
+
+def _chunks(recipes, size):
+    for start in range(0, len(recipes), size):
+        yield recipes[start:start + size]
+
+
+def export_csv(recipes, chunk_size=CHUNK_SIZE):
+    """Yield the CSV file in chunks of chunk_size rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_COLUMNS)
+    for chunk in _chunks(recipes, chunk_size):
+        writer.writerows([
+            recipe['name'],
+            recipe.get('category', 'Main Course'),
+            ', '.join(recipe['ingredients']),
+            recipe.get('instructions', ''),
+            recipe.get('prep_time', 0),
+            recipe.get('difficulty', 'Easy'),
+            recipe.get('youtube_url', ''),
+            'Yes' if recipe.get('is_favorite', False) else 'No',
+            recipe.get('created_at', ''),
+        ] for recipe in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # header of an empty export
+
+
+def export_ndjson(recipes, chunk_size=CHUNK_SIZE):
+    """Yield one JSON recipe per line, chunk_size lines at a time"""
+    for chunk in _chunks(recipes, chunk_size):
+        with metrics.timer('recipe_json_seconds', op='serialize'):
+            data = b''.join(fastjson.dumps(recipe) + b'\n' for recipe in chunk)
+        yield data
+
+
+class _StreamSink:
+    """File-like object for ParquetWriter that hands out what was written so far
+
+    ParquetWriter asks tell() for offsets it stores in the footer, so we count
+    every byte even after handing it out.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def take(self):
+        """Return and forget everything written since the last call"""
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_available():
+    """Whether pyarrow is installed, without paying for importing it"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_parquet(recipes, chunk_size=CHUNK_SIZE * 10):
+    """Yield a Parquet file, with one row group per chunk built column by column"""
+    # pyarrow takes a while to import and is optional, so only parquet exports load it
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('name', pyarrow.string()),
+        ('category', pyarrow.string()),
+        ('ingredients', pyarrow.list_(pyarrow.string())),
+        ('instructions', pyarrow.string()),
+        ('prep_time', pyarrow.float64()),
+        ('difficulty', pyarrow.string()),
+        ('youtube_url', pyarrow.string()),
+        ('is_favorite', pyarrow.bool_()),
+        ('created_at', pyarrow.string()),
+    ])
+    defaults = {'category': 'Main Course', 'instructions': '', 'prep_time': 0, 'difficulty': 'Easy',
+                'youtube_url': '', 'is_favorite': False, 'created_at': ''}
+
+    sink = _StreamSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    for chunk in _chunks(recipes, chunk_size):
+        columns = {field: [recipe.get(field, defaults.get(field)) for recipe in chunk]
+                   for field in schema.names}
+        writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+EXPORTERS = {'csv': export_csv, 'ndjson': export_ndjson, 'parquet': export_parquet}
@@ -0,0 +1,686 @@
+import heapq
+import random
+import re
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase words"""
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """Inverted index from name and ingredient words to recipe ids
+
+    Words are also kept in a sorted list so a prefix like "tom" can find
+    "tomato" and "tomatoes" with a binary search instead of a full scan.
+    """
+
+    def __init__(self, recipes=()):
+        self._postings = {}  # word -> set of recipe ids
+        self._recipe_words = {}  # recipe id -> words indexed for it
+        for recipe in recipes:
+            words = self._words_for(recipe)
+            for word in words:
+                self._postings.setdefault(word, set()).add(recipe['id'])
+            self._recipe_words[recipe['id']] = words
+        self._words = sorted(self._postings)  # every word in _postings
+
+    def _words_for(self, recipe):
+        words = set(tokenize(recipe['name']))
+        for ingredient in recipe['ingredients']:
+            words.update(tokenize(ingredient))
+        return frozenset(words)
+
+    def add(self, recipe):
+        """Index a recipe, replacing whatever was indexed for its id before"""
+        words = self._words_for(recipe)
+        old_words = self._recipe_words.get(recipe['id'], frozenset())
+        if words == old_words:
+            return
+        self._remove_words(recipe['id'], old_words - words)
+        for word in words - old_words:
+            ids = self._postings.get(word)
+            if ids is None:
+                ids = self._postings[word] = set()
+                insort(self._words, word)
+            ids.add(recipe['id'])
+        self._recipe_words[recipe['id']] = words
+
+    def remove(self, recipe_id):
+        """Drop a recipe from the index"""
+        self._remove_words(recipe_id, self._recipe_words.pop(recipe_id, ()))
+
+    def _remove_words(self, recipe_id, words):
+        for word in words:
+            ids = self._postings[word]
+            ids.discard(recipe_id)
+            if not ids:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+
+    def words_with_prefix(self, prefix):
+        """Yield the indexed words that start with prefix, in sorted order"""
+        index = bisect_left(self._words, prefix)
+        while index < len(self._words) and self._words[index].startswith(prefix):
+            yield self._words[index]
+            index += 1
+
+    def _prefix_ids(self, prefix):
+        ids = set()
+        for word in self.words_with_prefix(prefix):
+            ids |= self._postings[word]
+        return ids
+
+    def suggest(self, text, limit=10):
+        """Return up to limit ids for type-ahead, matching every word in text as a prefix
+
+        Words before the last one narrow the candidates; the last (still being
+        typed) word is walked in sorted order, so an exact word comes before
+        longer ones and we stop as soon as we have enough ids.
+        """
+        terms = tokenize(text)
+        if not terms or limit <= 0:
+            return []
+        
+        candidates = None
+        for term in sorted(set(terms[:-1]), key=len, reverse=True):  # longer words match fewer recipes
+            ids = self._prefix_ids(term)
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+        
+        found = {}  # recipe id -> None, keeps first-match order
+        for word in self.words_with_prefix(terms[-1]):
+            ids = self._postings[word]
+            if candidates is not None:
+                ids = ids & candidates
+            for recipe_id in ids:
+                found.setdefault(recipe_id)
+                if len(found) == limit:
+                    return list(found)
+        return list(found)
+
+    def search(self, query):
+        """Return recipe ids matching any query word as a prefix, most matched words first"""
+        matches = {}  # recipe id -> number of query words it matched
+        for term in set(tokenize(query)):
+            for recipe_id in self._prefix_ids(term):
+                matches[recipe_id] = matches.get(recipe_id, 0) + 1
+        return sorted(matches, key=lambda recipe_id: (-matches[recipe_id], recipe_id))
+
+
+class FieldIndex:
+    """Hash index from a field value to the ids of the recipes that have it"""
+
+    def __init__(self):
+        self._ids = {}  # value -> set of recipe ids
+        self._values = {}  # recipe id -> value
+
+    def add(self, recipe_id, value):
+        if recipe_id in self._values:
+            if self._values[recipe_id] == value:
+                return
+            self.remove(recipe_id)
+        self._ids.setdefault(value, set()).add(recipe_id)
+        self._values[recipe_id] = value
+
+    def remove(self, recipe_id):
+        if recipe_id not in self._values:
+            return
+        value = self._values.pop(recipe_id)
+        ids = self._ids[value]
+        ids.discard(recipe_id)
+        if not ids:
+            del self._ids[value]
+
+    def ids(self, value):
+        """Return the set of ids with this value (don't modify it)"""
+        return self._ids.get(value, set())
+
+
+class SortedIndex:
+    """Keeps (value, id) pairs sorted, so ranges and ordered listings need no sorting"""
+
+    def __init__(self, pairs=()):
+        self._entries = sorted(pairs)  # (value, recipe id)
+        self._values = {recipe_id: value for value, recipe_id in self._entries}
+
+    def add(self, recipe_id, value):
+        if recipe_id in self._values:
+            if self._values[recipe_id] == value:
+                return
+            self.remove(recipe_id)
+        insort(self._entries, (value, recipe_id))
+        self._values[recipe_id] = value
+
+    def remove(self, recipe_id):
+        if recipe_id not in self._values:
+            return
+        value = self._values.pop(recipe_id)
+        del self._entries[bisect_left(self._entries, (value, recipe_id))]
+
+    def value(self, recipe_id):
+        return self._values[recipe_id]
+
+    def _bounds(self, low, high):
+        start = 0 if low is None else bisect_left(self._entries, (low,))
+        end = len(self._entries) if high is None else bisect_right(self._entries, (high, float('inf')))
+        return start, end
+
+    def count(self, low=None, high=None):
+        """Return how many ids have low <= value <= high"""
+        start, end = self._bounds(low, high)
+        return max(end - start, 0)
+
+    def ids(self, low=None, high=None, descending=False, offset=0, limit=None):
+        """Return ids with low <= value <= high, ordered by value
+
+        offset and limit pick a page of them, and only that page is copied,
+        walking back from the end when descending.
+        """
+        start, end = self._bounds(low, high)
+        if descending:
+            stop = max(end - offset, start)
+            first = start if limit is None else max(stop - limit, start)
+            entries = reversed(self._entries[first:stop])
+        else:
+            first = start + offset
+            stop = end if limit is None else min(first + limit, end)
+            entries = self._entries[first:stop]
+        return [recipe_id for _, recipe_id in entries]
+
+
+def _as_number(value):
+    """prep_time should be a number, but hand-edited files may have anything in it"""
+    if isinstance(value, bool):
+        return 0
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class QueryIndex:
+    """Secondary indexes for filtering and sorting recipes without looking at all of them
+
+    Categorical fields get a hash index, fields we sort or take ranges over get
+    a sorted index.
+    """
+
+    FIELDS = ('category', 'difficulty', 'is_favorite')
+    SORTED_FIELDS = ('prep_time', 'created_at', 'name')
+
+    def __init__(self, recipes=()):
+        self._fields = {field: FieldIndex() for field in self.FIELDS}
+        sorted_pairs = {field: [] for field in self.SORTED_FIELDS}
+        for recipe in recipes:
+            values = self._values_for(recipe)
+            for field in self.FIELDS:
+                self._fields[field].add(recipe['id'], values[field])
+            for field in self.SORTED_FIELDS:
+                sorted_pairs[field].append((values[field], recipe['id']))
+        self._sorted = {field: SortedIndex(pairs) for field, pairs in sorted_pairs.items()}
+
+    def _values_for(self, recipe):
+        # same defaults the API fills in for new recipes
+        return {
+            'category': recipe.get('category', 'Main Course'),
+            'difficulty': recipe.get('difficulty', 'Easy'),
+            'is_favorite': bool(recipe.get('is_favorite', False)),
+            'prep_time': _as_number(recipe.get('prep_time', 0)),
+            'created_at': str(recipe.get('created_at', '')),
+            'name': recipe['name'].lower(),
+        }
+
+    def add(self, recipe):
+        """Index a recipe, replacing whatever was indexed for its id before"""
+        values = self._values_for(recipe)
+        for field in self.FIELDS:
+            self._fields[field].add(recipe['id'], values[field])
+        for field in self.SORTED_FIELDS:
+            self._sorted[field].add(recipe['id'], values[field])
+
+    def remove(self, recipe_id):
+        for index in self._fields.values():
+            index.remove(recipe_id)
+        for index in self._sorted.values():
+            index.remove(recipe_id)
+
+    def query(self, equals=None, ranges=None, sort=None, descending=False, offset=0, limit=None):
+        """Return (ids, total) for one page of matching recipes in order
+
+        equals maps FIELDS to the value they must have, ranges maps
+        SORTED_FIELDS to (low, high) bounds where either may be None, and sort
+        is one of SORTED_FIELDS. ids skips offset matches and has at most
+        limit, total counts them all. Returns None when there's nothing to
+        filter or sort, meaning "all recipes in their usual order".
+        """
+        equals = equals or {}
+        ranges = ranges or {}
+        if not equals and not ranges and sort is None:
+            return None
+
+        if sort is not None and not equals and set(ranges) <= {sort}:
+            # the sorted index already has them in order, so read just the page from it
+            index = self._sorted[sort]
+            low, high = ranges.get(sort, (None, None))
+            return index.ids(low, high, descending, offset, limit), index.count(low, high)
+
+        # start with the smallest set so the intersections stay cheap
+        sets = sorted((self._fields[field].ids(value) for field, value in equals.items()), key=len)
+        candidates = set(sets[0]) if sets else None
+        for ids in sets[1:]:
+            candidates &= ids
+
+        for field, (low, high) in ranges.items():
+            ids = self._sorted[field].ids(low, high)
+            candidates = set(ids) if candidates is None else candidates.intersection(ids)
+
+        if sort is None:
+            ordered = sorted(candidates)  # ids go up in the order recipes were added
+        else:
+            index = self._sorted[sort]
+            ordered = sorted(candidates, key=lambda recipe_id: (index.value(recipe_id), recipe_id))
+        if descending:
+            ordered.reverse()
+        stop = None if limit is None else offset + limit
+        return ordered[offset:stop], len(ordered)
+
+
+# words in an ingredient line that say how much or how it's cut rather than what it is
+AMOUNT_WORDS = frozenset("""
+    a an of few some about approx handful pinch pinches dash drop drops
+    tsp tsps teaspoon teaspoons tbsp tbsps tablespoon tablespoons cup cups
+    g gm gms gram grams kg kgs mg ml l ltr litre litres liter liters
+    oz ounce ounces lb lbs pound pounds inch inches cm
+    small medium large big heaped level
+    chopped sliced diced minced grated crushed boiled peeled finely roughly coarsely
+""".split())
+
+# prep notes and alternatives after the ingredient itself: ", chopped", "+ for greasing", "/ optional"
+_NOTE_RE = re.compile(r'[,+;:]|/(?!\d)| for | to taste| as needed| as required| optional')
+_PARENS_RE = re.compile(r'\([^)]*\)?')
+
+
+@lru_cache(maxsize=65536)  # the same few thousand ingredients come up over and over
+def normalize_ingredient(name):
+    """Reduce an ingredient line to a plain key, so "2 large Tomatoes, chopped" and "tomato" match
+
+    Headings like "For the gravy" give ''.
+    """
+    text = _PARENS_RE.sub(' ', name.lower()).strip()
+    if text.startswith('for '):
+        return ''
+    text = _NOTE_RE.split(' ' + text, 1)[0]
+    words = [word for word in tokenize(text) if word not in AMOUNT_WORDS and not word[0].isdigit()
+             and not word.isnumeric()]
+    if not words:
+        return ''
+    # naive singular of the last word: tomatoes -> tomato, berries -> berry, eggs -> egg
+    last = words[-1]
+    if len(last) > 4 and last.endswith('ies'):
+        last = last[:-3] + 'y'
+    elif len(last) > 4 and last.endswith('oes'):
+        last = last[:-2]
+    elif len(last) > 3 and last.endswith('s') and not last.endswith(('ss', 'us', 'is')):
+        last = last[:-1]
+    words[-1] = last
+    return ' '.join(words)
+
+
+def _bitset(ids):
+    """Build an int with bit i set for every i in ids"""
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        data[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _bits_of(bits):
+    """Yield the positions of the set bits, lowest first"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield index * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+def _tagged(bits, matched, total):
+    for recipe_id in _bits_of(bits):
+        yield recipe_id, matched, total
+
+
+class IngredientIndex:
+    """Recipe ids per normalized ingredient, for pantry matching
+
+    Ingredients in real recipes are mostly free text, so almost every one is
+    distinct and is kept as a small set of ids. Matching works on bitsets
+    (recipe ids are bit positions in plain Python ints, so combining whole
+    ingredients is one big-int operation instead of a loop over recipes);
+    those are built from the sets for the ingredients a pantry asks about,
+    and only the last BITSET_CACHE_SIZE of them are kept. Recipes are also
+    grouped by how many ingredients they have, which is all the ranking needs.
+    """
+
+    BITSET_CACHE_SIZE = 256
+
+    def __init__(self, recipes=()):
+        self._ingredients = {}  # recipe id -> frozenset of its normalized ingredients
+        self._postings = {}  # normalized ingredient -> set of recipe ids
+        self._bits = {}  # normalized ingredient -> bitset of its ids, for recently matched ones
+        sizes = {}  # number of ingredients -> list of recipe ids
+        for recipe in recipes:
+            ingredients = self._normalized(recipe)
+            self._ingredients[recipe['id']] = ingredients
+            for ingredient in ingredients:
+                self._postings.setdefault(ingredient, set()).add(recipe['id'])
+            sizes.setdefault(len(ingredients), []).append(recipe['id'])
+        # built in one go, setting bits one at a time would copy the int every time
+        self._sizes = {size: _bitset(members) for size, members in sizes.items()}
+
+    def __getstate__(self):
+        # the bitsets are only a cache, no point saving them with a snapshot
+        return dict(self.__dict__, _bits={})
+
+    def _normalized(self, recipe):
+        return frozenset(filter(None, map(normalize_ingredient, recipe['ingredients'])))
+
+    def add(self, recipe):
+        """Index a recipe, replacing whatever was indexed for its id before"""
+        ingredients = self._normalized(recipe)
+        if self._ingredients.get(recipe['id']) == ingredients:
+            return
+        self.remove(recipe['id'])
+        bit = 1 << recipe['id']
+        for ingredient in ingredients:
+            self._postings.setdefault(ingredient, set()).add(recipe['id'])
+            if ingredient in self._bits:
+                self._bits[ingredient] |= bit
+        self._sizes[len(ingredients)] = self._sizes.get(len(ingredients), 0) | bit
+        self._ingredients[recipe['id']] = ingredients
+
+    def remove(self, recipe_id):
+        ingredients = self._ingredients.pop(recipe_id, None)
+        if ingredients is None:
+            return
+        mask = ~(1 << recipe_id)
+        for ingredient in ingredients:
+            ids = self._postings[ingredient]
+            ids.discard(recipe_id)
+            if not ids:
+                del self._postings[ingredient]
+                self._bits.pop(ingredient, None)
+            elif ingredient in self._bits:
+                self._bits[ingredient] &= mask
+        self._sizes[len(ingredients)] &= mask
+        if not self._sizes[len(ingredients)]:
+            del self._sizes[len(ingredients)]
+
+    def _bitset_for(self, ingredient):
+        """Return the ingredient's ids as a bitset, 0 if no recipe uses it"""
+        bits = self._bits.get(ingredient)
+        if bits is None:
+            ids = self._postings.get(ingredient)
+            if not ids:
+                return 0
+            bits = _bitset(ids)
+            # readers share the cache under the store's read lock, so it's only
+            # ever added to or cleared, both single steps for a dict
+            if len(self._bits) >= self.BITSET_CACHE_SIZE:
+                self._bits.clear()
+            self._bits[ingredient] = bits
+        return bits
+
+    def match(self, pantry, rank_by='coverage', max_missing=None, limit=None):
+        """Return (recipe id, ingredients we have, ingredients it needs) for recipes using the pantry
+
+        Recipes sharing no ingredient with the pantry are left out. rank_by
+        'coverage' puts the highest fraction of ingredients on hand first,
+        'missing' the fewest ingredients still to buy; each breaks the other's
+        ties, then lower ids come first.
+        """
+        pantry = [bits for bits in map(self._bitset_for, set(filter(None, map(normalize_ingredient, pantry))))
+                  if bits]
+        if not pantry:
+            return []
+
+        # add the pantry's bitsets up as binary counters: bit i of digits[k]
+        # is bit k of how many pantry ingredients recipe i uses
+        digits = []
+        for carry in pantry:
+            k = 0
+            while carry:
+                if k == len(digits):
+                    digits.append(0)
+                digits[k], carry = digits[k] ^ carry, digits[k] & carry
+                k += 1
+        any_match = 0
+        for bits in pantry:
+            any_match |= bits
+
+        groups = {}  # rank key -> [(matched, total, bitset of recipes with that many)]
+        for matched in range(1, len(pantry) + 1):
+            exactly = any_match
+            for k, digit in enumerate(digits):
+                exactly &= digit if matched >> k & 1 else ~digit
+            if not exactly:
+                continue
+            for total, members in self._sizes.items():
+                if total < matched or (max_missing is not None and total - matched > max_missing):
+                    continue
+                bits = exactly & members
+                if bits:
+                    if rank_by == 'missing':
+                        key = (total - matched, -matched / total)
+                    else:
+                        key = (-matched / total, total - matched)
+                    groups.setdefault(key, []).append((matched, total, bits))
+
+        results = []
+        for key in sorted(groups):
+            # e.g. 3 of 3 and 6 of 6 rank the same, so merge them by id
+            ranked = heapq.merge(*(_tagged(bits, matched, total) for matched, total, bits in groups[key]))
+            for match in ranked:
+                if len(results) == limit:
+                    return results
+                results.append(match)
+        return results
+
+
+def similarity_features(recipe):
+    """The set near-duplicate detection compares: normalized ingredients plus the words of the name"""
+    features = {'i:' + ingredient for ingredient in map(normalize_ingredient, recipe['ingredients']) if ingredient}
+    features.update('n:' + word for word in tokenize(recipe['name']))
+    return frozenset(features)
+
+
+def jaccard(a, b):
+    """Size of the intersection over size of the union, 0 for two empty sets"""
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+_MIX = 0x9E3779B97F4A7C15  # spreads 32-bit checksums over all 64 bits
+_EMPTY = 1 << _HASH_BITS  # bigger than any hash
+
+
+def _feature_hash(feature):
+    """A 64-bit hash of a feature that comes out the same in every process
+
+    str hashes change from one run to the next, and the index is saved with
+    store snapshots, so its bucket keys have to survive a restart.
+    """
+    return (zlib.crc32(feature.encode()) * _MIX) & _HASH_MASK
+
+
+class SimilarityIndex:
+    """MinHash signatures of recipes' similarity_features, banded into LSH buckets
+
+    Each feature is hashed once and falls into one of BANDS * ROWS bins, each
+    bin keeping its smallest hash (one-permutation MinHash, with empty bins
+    copying a filled bin picked the same way for every recipe). Two recipes
+    share a bucket in a band when all ROWS bins of that band agree, which gets
+    very likely once their Jaccard similarity passes about
+    (1 / BANDS) ** (1 / ROWS), so finding near-duplicates only looks at a few
+    candidates instead of every recipe.
+
+    A byte of every bin is also kept per recipe, so the share of bins two
+    recipes agree on gives a quick estimate of their similarity. It's only
+    an estimate, check what matters with jaccard().
+    """
+
+    BANDS = 16
+    ROWS = 4
+    ESTIMATE_MARGIN = 0.2  # how far below the wanted similarity an estimate may be and still count
+
+    def __init__(self, recipes=()):
+        self._bins = self.BANDS * self.ROWS
+        # for each bin, the order to look through the others when it's empty; fixed, so
+        # every recipe borrows the same way, and random, so neighbouring bins don't
+        # all copy the same value
+        rng = random.Random(0)
+        self._probes = [rng.sample(range(self._bins), self._bins) for _ in range(self._bins)]
+        self._buckets = [{} for _ in range(self.BANDS)]  # per band: band hash -> id, or list of ids
+        self._keys = {}  # recipe id -> (array of its band hashes, one byte per bin as an int)
+        for recipe in recipes:
+            self.add(recipe)
+
+    def _signature(self, features):
+        """Return the smallest hash per bin, or None if there are no features"""
+        bins = self._bins
+        signature = [_EMPTY] * bins
+        for feature in features:
+            value = _feature_hash(feature)
+            slot = value * bins >> _HASH_BITS
+            if value < signature[slot]:
+                signature[slot] = value
+        if _EMPTY not in signature:
+            return signature
+        if signature.count(_EMPTY) == bins:
+            return None
+        # densify: an empty bin copies the first filled bin in its probe order
+        filled = list(signature)
+        for slot, value in enumerate(signature):
+            if value == _EMPTY:
+                for probe in self._probes[slot]:
+                    value = signature[probe]
+                    if value != _EMPTY:
+                        filled[slot] = value
+                        break
+        return filled
+
+    def add(self, recipe, features=None):
+        """Index a recipe, replacing whatever was indexed for its id before"""
+        recipe_id = recipe['id']
+        self.remove(recipe_id)
+        signature = self._signature(similarity_features(recipe) if features is None else features)
+        if signature is None:
+            return
+        rows = self.ROWS
+        keys = array('q', [hash(tuple(signature[band * rows:band * rows + rows])) for band in range(self.BANDS)])
+        for buckets, key in zip(self._buckets, keys):
+            members = buckets.get(key)
+            if members is None:
+                buckets[key] = recipe_id  # most buckets only ever hold one recipe
+            elif type(members) is list:
+                members.append(recipe_id)
+            else:
+                buckets[key] = [members, recipe_id]
+        self._keys[recipe_id] = keys, int.from_bytes(bytes([value >> 32 & 0xFF for value in signature]), 'little')
+
+    def remove(self, recipe_id):
+        keys, _ = self._keys.pop(recipe_id, (None, None))
+        if keys is None:
+            return
+        for buckets, key in zip(self._buckets, keys):
+            members = buckets[key]
+            if type(members) is list:
+                members.remove(recipe_id)
+                if len(members) == 1:
+                    buckets[key] = members[0]
+            else:
+                del buckets[key]
+
+    def candidates(self, recipe_id, min_similarity=0.0):
+        """Return the ids sharing a bucket with an indexed recipe (not itself)
+
+        With min_similarity, those whose estimated similarity is well below it
+        are left out.
+        """
+        keys, fingerprint = self._keys.get(recipe_id, ((), 0))
+        found = set()
+        for buckets, key in zip(self._buckets, keys):
+            members = buckets[key]
+            if type(members) is list:
+                found.update(members)
+            else:
+                found.add(members)
+        found.discard(recipe_id)
+
+        if min_similarity > self.ESTIMATE_MARGIN:
+            # bins two recipes agree on come out as zero bytes
+            needed = (min_similarity - self.ESTIMATE_MARGIN) * self._bins
+            found = {other_id for other_id in found
+                     if (fingerprint ^ self._keys[other_id][1]).to_bytes(self._bins, 'little').count(0) >= needed}
+        return found
+
+
+class RecipeStats:
+    """Running totals behind GET /recipes/stats, kept up to date instead of recomputed"""
+
+    def __init__(self, recipes=()):
+        self.total = 0
+        self.prep_time_sum = 0
+        self.favorites = 0
+        self.categories = {}  # category -> number of recipes
+        self._counted = {}  # recipe id -> (prep_time, category, is_favorite) we added for it
+        for recipe in recipes:
+            self.add(recipe)
+
+    def add(self, recipe):
+        """Count a recipe, replacing whatever was counted for its id before"""
+        self.remove(recipe['id'])
+        counted = (_as_number(recipe.get('prep_time', 0)), recipe.get('category', 'Main Course'),
+                   bool(recipe.get('is_favorite', False)))
+        prep_time, category, is_favorite = counted
+        self.total += 1
+        self.prep_time_sum += prep_time
+        self.favorites += is_favorite
+        self.categories[category] = self.categories.get(category, 0) + 1
+        self._counted[recipe['id']] = counted
+
+    def remove(self, recipe_id):
+        counted = self._counted.pop(recipe_id, None)
+        if counted is None:
+            return
+        prep_time, category, is_favorite = counted
+        self.total -= 1
+        self.prep_time_sum -= prep_time
+        self.favorites -= is_favorite
+        self.categories[category] -= 1
+        if not self.categories[category]:
+            del self.categories[category]
+
+    def summary(self):
+        return {
+            "total_recipes": self.total,
+            "average_prep_time": self.prep_time_sum / self.total if self.total else 0,
+            # only a handful of categories, so this max is cheap
+            "most_common_category": max(self.categories, key=self.categories.get) if self.categories else None,
+            "favorite_count": self.favorites,
+            "categories": dict(self.categories),
+        }
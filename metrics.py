@@ -0,0 +1,193 @@
+"""Request, storage and JSON timings, served as Prometheus text at GET /metrics
+
+Everything goes into the module level `metrics` registry, so storage.py and
+store.py can record without knowing about Flask. instrument(app) adds the
+per-request hooks and, optionally, a sampled cProfile dump.
+"""
+import cProfile
+import itertools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+import fastjson
+
+# upper bounds in seconds, covering cached responses up to full rewrites
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# name -> (type, help text) for everything we record
+DESCRIPTIONS = {
+    'recipe_api_requests_total': ('counter', 'Requests handled, by route, method and status'),
+    'recipe_api_request_seconds': ('histogram', 'Time to build a response, by route and method'),
+    'recipe_api_request_bytes_total': ('counter', 'Request body bytes received, by route'),
+    'recipe_api_response_bytes_total': ('counter', 'Response body bytes sent (when known up front), by route'),
+    'recipe_json_seconds': ('histogram', 'Time spent in JSON parse / serialize for API bodies'),
+    'recipe_storage_seconds': ('histogram', 'Time spent reading from or writing to the storage backend'),
+    'recipe_storage_operations_total': ('counter', 'Storage reads that found changes, and writes'),
+    'recipe_storage_bytes_total': ('counter', 'Bytes read from or written to storage, by backend'),
+    'recipe_profiles_total': ('counter', 'Requests profiled with cProfile'),
+}
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class Histogram:
+    """Cumulative bucket counts plus sum and count, like a Prometheus histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{_label_text(labels + (("le", repr(float(bound))),))} {cumulative}'
+        yield f'{name}_bucket{_label_text(labels + (("le", "+Inf"),))} {self.count}'
+        yield f'{name}_sum{_label_text(labels)} {self.sum}'
+        yield f'{name}_count{_label_text(labels)} {self.count}'
+
+
+class Metrics:
+    """Thread safe counters and histograms keyed by name and labels"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}  # (name, labels) -> number
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe how long the with block took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Return everything recorded so far in the Prometheus text format"""
+        with self._lock:
+            series = {}  # name -> list of lines
+            for (name, labels), value in sorted(self._counters.items()):
+                series.setdefault(name, []).append(f'{name}{_label_text(labels)} {value}')
+            for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                series.setdefault(name, []).extend(histogram.lines(name, labels))
+
+        lines = []
+        for name in sorted(series):
+            kind, help_text = DESCRIPTIONS.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(series[name])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class TimedJSONProvider(fastjson.JSONProvider):
+    """The app's JSON provider, timing every parse and serialize"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.timer('recipe_json_seconds', op='serialize'):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with metrics.timer('recipe_json_seconds', op='parse'):
+            return super().loads(s, **kwargs)
+
+
+def _route_label():
+    # the URL rule keeps ids out of the labels, so there's one series per route
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def instrument(app, profile_every=0, profile_dir='profiles'):
+    """Record latency, status and sizes for every request of app
+
+    With profile_every=N, one request in N runs under cProfile and its stats
+    are dumped to profile_dir as <time>-<method>-<route>.prof (open them
+    with pstats or snakeviz). Streamed responses are timed up to the point
+    where the body starts streaming.
+    """
+    app.json = TimedJSONProvider(app)
+    request_numbers = itertools.count(1)
+    profile_lock = threading.Lock()  # cProfile can't profile two threads at once
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        g.profiler = None
+        if profile_every and next(request_numbers) % profile_every == 0 and profile_lock.acquire(blocking=False):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request(response):
+        route = _route_label()
+        metrics.observe('recipe_api_request_seconds', time.perf_counter() - g.metrics_start,
+                        route=route, method=request.method)
+        metrics.inc('recipe_api_requests_total', route=route, method=request.method,
+                    status=response.status_code)
+        if request.content_length:
+            metrics.inc('recipe_api_request_bytes_total', request.content_length, route=route)
+        if response.content_length is not None:
+            metrics.inc('recipe_api_response_bytes_total', response.content_length, route=route)
+        return response
+
+    @app.teardown_request
+    def stop_profiler(error=None):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        try:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            route = re.sub(r'[^\w]+', '_', _route_label()).strip('_') or 'root'
+            filename = f'{time.time():.6f}-{request.method}-{route}.prof'
+            profiler.dump_stats(os.path.join(profile_dir, filename))
+            metrics.inc('recipe_profiles_total', route=_route_label())
+        finally:
+            profile_lock.release()
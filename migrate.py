@@ -0,0 +1,34 @@
+"""Copy recipes from the JSON file into a SQLite database
+
+Usage: python migrate.py [recipes.json] [recipes.db]
+
+Then start the API with RECIPE_STORAGE=sqlite to use the database.
+Recipes that are already in the database are overwritten by id.
+"""
+import os
+import sys
+
+from storage import JsonFileBackend, SqliteBackend
+from store import RecipeStore
+
+
+def migrate(json_path, db_path):
+    """Import every recipe (including a pending journal) and return how many there were"""
+    journal = os.path.exists(json_path + '.log')
+    source = RecipeStore(JsonFileBackend(json_path, journal=journal))
+    recipes = source.all()
+
+    target = SqliteBackend(db_path)
+    with target.lock():
+        snapshot, _ = target.read_changes(strict=True)
+        next_id = max(source.next_id(), snapshot[1] if snapshot else 1)
+        # one transaction for the whole import
+        target.write([{"op": "put", "recipe": recipe} for recipe in recipes], None, next_id)
+    return len(recipes)
+
+
+if __name__ == '__main__':
+    json_path = sys.argv[1] if len(sys.argv) > 1 else 'recipes.json'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else 'recipes.db'
+    count = migrate(json_path, db_path)
+    print(f"Copied {count} recipes from {json_path} to {db_path}")
@@ -0,0 +1,156 @@
+"""The Recipe type the store keeps in memory, and the one place request data is checked
+
+A Recipe keeps its fields in __slots__ instead of a per-recipe dict, and the
+strings that repeat across recipes (difficulty, category, ingredients) are
+interned, so a million recipes share one copy of "Easy" or "salt". It can be
+read like a dict (recipe['name'], recipe.get('category')), so the indexes
+and exporters don't care which one they get.
+"""
+import sys
+from datetime import datetime
+
+from youtube import video_id
+
+DIFFICULTIES = ('Easy', 'Medium', 'Hard')
+CATEGORIES = ('Main Course', 'Dessert', 'Appetizer', 'Breakfast', 'Snack', 'Beverage')
+
+# field -> value used when a request or an old file leaves it out
+DEFAULTS = {
+    'instructions': '',
+    'prep_time': 0,
+    'difficulty': 'Easy',
+    'category': 'Main Course',
+    'youtube_url': '',
+    'is_favorite': False,
+    'created_at': '',
+}
+
+FIELDS = ('id', 'name', 'ingredients', 'instructions', 'prep_time', 'difficulty', 'category',
+          'youtube_url', 'youtube_id', 'is_favorite', 'created_at')
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class Recipe:
+    """One recipe, read-only once built (replace() makes a changed copy)"""
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, id, name, ingredients, instructions='', prep_time=0, difficulty='Easy',
+                 category='Main Course', youtube_url='', youtube_id=None, is_favorite=False, created_at='',
+                 extra=None):
+        self.id = id
+        self.name = name
+        self.ingredients = tuple(_intern(ingredient) for ingredient in ingredients)
+        self.instructions = instructions
+        self.prep_time = prep_time
+        self.difficulty = _intern(difficulty)
+        self.category = _intern(category)
+        self.youtube_url = youtube_url
+        # parsed once and saved with the recipe, only recipes from older files get it here on load
+        self.youtube_id = video_id(youtube_url) if youtube_id is None else youtube_id
+        self.is_favorite = is_favorite
+        self.created_at = _intern(created_at)  # lots of recipes share a date
+        self.extra = extra  # fields we don't know about, kept so nothing is lost on save
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Recipe from a stored or validated dict"""
+        known = {field: data[field] for field in FIELDS if field in data}
+        extra = {key: value for key, value in data.items() if key not in known} or None
+        return cls(extra=extra, **known)
+
+    def to_dict(self):
+        """Return the recipe as a plain dict, ready for JSON"""
+        data = {field: getattr(self, field) for field in FIELDS}
+        data['ingredients'] = list(self.ingredients)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __reduce__(self):
+        # pickled as the constructor's arguments in order, see RecipeStore.save_snapshot
+        return Recipe, tuple(getattr(self, field) for field in FIELDS) + (self.extra,)
+
+    def replace(self, **changes):
+        """Return a copy with some fields changed"""
+        data = {field: getattr(self, field) for field in FIELDS}
+        if 'youtube_url' in changes:
+            data['youtube_id'] = None  # parse the new one
+        data.update(changes)
+        return Recipe(extra=self.extra, **data)
+
+    # read-only dict access
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in FIELDS or bool(self.extra and key in self.extra)
+
+    def __eq__(self, other):
+        if not isinstance(other, Recipe):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Recipe(id={self.id!r}, name={self.name!r})"
+
+
+def validate_recipe(data):
+    """Return what's wrong with posted recipe data, or None if it's fine"""
+    if not isinstance(data, dict):
+        return "Recipe must be a JSON object"
+
+    if not data.get('name'):
+        return "Recipe name is required"
+    if not isinstance(data['name'], str):
+        return "Recipe name must be text"
+
+    if not data.get('ingredients'):
+        return "Ingredients are required"
+    if not isinstance(data['ingredients'], list) or not all(isinstance(i, str) for i in data['ingredients']):
+        return "Ingredients must be a list of text"
+
+    if not isinstance(data.get('youtube_url') or '', str):
+        return "youtube_url must be text"
+
+    if not isinstance(data.get('instructions', ''), str):
+        return "instructions must be text"
+
+    # these are indexed, so anything unexpected would break the indexes rather than just look odd
+    if data.get('difficulty', DEFAULTS['difficulty']) not in DIFFICULTIES:
+        return f"difficulty must be one of: {', '.join(DIFFICULTIES)}"
+    if data.get('category', DEFAULTS['category']) not in CATEGORIES:
+        return f"category must be one of: {', '.join(CATEGORIES)}"
+    if not isinstance(data.get('is_favorite', False), bool):
+        return "is_favorite must be true or false"
+
+    prep_time = data.get('prep_time', 0)
+    if isinstance(prep_time, bool) or not isinstance(prep_time, (int, float)):
+        return "prep_time must be a number"
+
+    return None
+
+
+def recipe_fields(data):
+    """Build the fields we store for a recipe from validated request data"""
+    fields = {field: data.get(field, default) for field, default in DEFAULTS.items()}
+    fields['name'] = data['name']
+    fields['ingredients'] = data['ingredients']
+    fields['created_at'] = datetime.now().strftime('%Y-%m-%d')  # edits keep the original date
+    return fields
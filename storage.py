@@ -0,0 +1,437 @@
+"""Places RecipeStore can keep recipes
+
+A backend only deals with getting changes onto disk and noticing changes other
+processes made. Every backend has the same methods:
+
+    is_stale()              cheap check whether someone else wrote since we last looked
+    forget()                make the next read_changes return a full snapshot
+    lock()                  context manager that keeps other processes from writing
+    read_changes(strict)    -> (snapshot, entries), see JsonFileBackend.read_changes
+    write(changes, recipes, next_id)
+                            make a list of log entries durable, recipes holds
+                            every recipe already encoded by fastjson.dumps
+    needs_compaction()      whether compact() on the store would help
+    position()              where we are in the stored data, saved with a store snapshot
+    resume(position)        pick up from a saved position, so read_changes only returns
+                            what changed after it; False if it's from somewhere else
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import fastjson
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+def _stat(path):
+    """Return (inode, mtime, size) of a file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _write_temp(path, data):
+    """Write bytes to a new temp file next to path and return the temp file's name"""
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    metrics.inc('recipe_storage_bytes_total', len(data), direction='write', backend='json')
+    return tmp_path
+
+
+def _atomic_write(path, data):
+    """Replace a file in one step, so readers never see it half-written"""
+    os.replace(_write_temp(path, data), path)
+
+
+class JsonFileBackend:
+    """Keeps recipes in a JSON file, like the app always has
+
+    In journal mode each change is appended as one line to a log file next to
+    the data file instead of rewriting the whole file. Once the log gets long
+    the store folds it back into the data file in the background.
+
+    Several processes can share the same files: writes hold an exclusive lock
+    on recipes.json.lock and re-read whatever the other processes wrote first.
+    """
+
+    def __init__(self, path, journal=False, compact_every=1000):
+        self.path = path
+        self.meta_path = path + '.meta'
+        self.log_path = path + '.log'
+        self.lock_path = path + '.lock'
+        self.journal = journal
+        self.compact_every = compact_every
+        self._generation = 0  # bumped on every full rewrite, see read_changes
+        self._data_signature = None
+        self._log_signature = None
+        self._log_offset = 0  # how many bytes of the log are already applied
+        self._log_entries = 0  # entries written since the last compaction
+
+    def _log_stat(self):
+        """Return (inode, size) of the log, or None if it doesn't exist"""
+        try:
+            stat = os.stat(self.log_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def is_stale(self):
+        """Check whether the files changed since we last read or wrote them"""
+        log_signature = self._log_stat() if self.journal else None
+        return _stat(self.path) != self._data_signature or log_signature != self._log_signature
+
+    def forget(self):
+        """Forget what we've seen, so the next read_changes loads everything again"""
+        self._data_signature = None
+        self._log_signature = None
+
+    def position(self):
+        """Return what we've read so far: file signatures, generation and log offset"""
+        return ('json', os.path.abspath(self.path), self.journal, self._generation, self._data_signature,
+                self._log_signature, self._log_offset, self._log_entries)
+
+    def resume(self, position):
+        """Continue from a position(), as if we had read the files up to there"""
+        if position[:3] != ('json', os.path.abspath(self.path), self.journal):
+            return False
+        (self._generation, self._data_signature, self._log_signature, self._log_offset,
+         self._log_entries) = position[3:]
+        return True
+
+    @contextmanager
+    def lock(self):
+        """Keep other processes from writing while we hold this"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_changes(self, strict=False):
+        """Return (snapshot, entries) describing what changed on disk since we last looked
+
+        snapshot is None, or a (recipes, next_id) pair that replaces everything
+        in memory. entries are log entries to apply on top of it. With strict,
+        also catch rewrites that left the file signatures unchanged.
+        """
+        data_signature = _stat(self.path)
+        log_signature = self._log_stat() if self.journal else None
+        if data_signature == self._data_signature and log_signature == self._log_signature:
+            # two rewrites in the same clock tick can leave the same signature
+            # behind, so writers also compare the generation in the meta file
+            if not strict or self.journal or self._load_meta().get('generation', 0) == self._generation:
+                return None, []
+
+        # someone only appended to the log, so just read the new entries
+        elif (data_signature == self._data_signature and log_signature is not None
+                and self._log_signature is not None
+                and log_signature[0] == self._log_signature[0]
+                and log_signature[1] >= self._log_offset):
+            entries = self._read_log()
+            self._log_signature = log_signature
+            return None, entries
+
+        meta = self._load_meta()
+        recipes = []
+        if data_signature is not None:
+            try:
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+                metrics.inc('recipe_storage_bytes_total', len(data), direction='read', backend='json')
+                recipes = fastjson.loads(data)
+            except (OSError, ValueError):
+                # unreadable file, keep what we have and try again next time
+                if self._data_signature is not None:
+                    return None, []
+        self._generation = meta.get('generation', 0)
+        self._data_signature = data_signature
+        self._log_offset = 0
+        self._log_entries = 0
+        entries = self._read_log() if self.journal else []
+        self._log_signature = log_signature
+        return (recipes, meta.get('next_id', 1)), entries
+
+    def _read_log(self):
+        """Return the log entries we haven't seen yet"""
+        try:
+            with open(self.log_path, 'rb') as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except OSError:
+            return []
+        metrics.inc('recipe_storage_bytes_total', len(data), direction='read', backend='json')
+
+        # a last line without a newline was cut off mid-write, skip it
+        end = data.rfind(b'\n') + 1
+        entries = []
+        for line in data[:end].splitlines():
+            try:
+                entries.append(fastjson.loads(line))
+            except ValueError:
+                continue
+        self._log_offset += end
+        self._log_entries += len(entries)
+        return entries
+
+    def _load_meta(self):
+        """Read the id counter and write generation saved next to the data file"""
+        try:
+            with open(self.meta_path, 'rb') as f:
+                meta = fastjson.loads(f.read())
+        except (OSError, ValueError):
+            return {}
+        return meta if isinstance(meta, dict) else {}
+
+    def _save_meta(self, next_id):
+        """Save the id counter, so ids of deleted recipes are never reused"""
+        meta = {"next_id": next_id, "generation": self._generation}
+        _atomic_write(self.meta_path, fastjson.dumps(meta))
+
+    def write(self, changes, recipes, next_id):
+        """Make changes durable, either by logging them or rewriting the whole file"""
+        if not self.journal:
+            _atomic_write(self.path, fastjson.join_array(recipes))
+            self._data_signature = _stat(self.path)
+            # the meta file goes second, a crash in between only costs an extra reload
+            self._generation += 1
+            self._save_meta(next_id)
+            return
+
+        data = b''.join(fastjson.dumps(change) + b'\n' for change in changes)
+        with open(self.log_path, 'ab') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > self._log_offset:
+                # the last line was cut off by a crash, start on a fresh line
+                data = b'\n' + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        metrics.inc('recipe_storage_bytes_total', len(data), direction='write', backend='json')
+        self._log_offset = size + len(data)
+        self._log_entries += len(changes)
+        self._log_signature = self._log_stat()
+
+    def needs_compaction(self):
+        return self.journal and self._log_entries >= self.compact_every
+
+    def start_compaction(self, recipes, next_id):
+        """Note where the log is, so finish_compaction knows what to carry over"""
+        if not self.journal:
+            return None
+        return {"recipes": recipes, "next_id": next_id, "data_signature": self._data_signature,
+                "offset": self._log_offset, "entries": self._log_entries}
+
+    def write_compaction(self, job):
+        """Write the new snapshot to a temp file, called without holding any lock"""
+        job['tmp_path'] = _write_temp(self.path, fastjson.join_array(job['recipes']))
+
+    def finish_compaction(self, job):
+        """Swap in the new snapshot and a log holding only what came after it"""
+        if self._data_signature != job['data_signature']:
+            # another process compacted first, our snapshot is stale
+            os.remove(job['tmp_path'])
+            return
+
+        # carry over anything that was logged while we were writing
+        try:
+            with open(self.log_path, 'rb') as f:
+                f.seek(job['offset'])
+                tail = f.read()
+        except OSError:
+            tail = b''
+        log_tmp_path = _write_temp(self.log_path, tail)
+
+        self._save_meta(job['next_id'])
+        # replaying an old log over the new snapshot gives the same result,
+        # so a crash between these two renames loses nothing
+        os.replace(job['tmp_path'], self.path)
+        os.replace(log_tmp_path, self.log_path)
+        self._data_signature = _stat(self.path)
+        self._log_signature = self._log_stat()
+        self._log_offset = len(tail)
+        self._log_entries -= job['entries']
+
+
+class SqliteBackend:
+    """Keeps recipes in a SQLite database in WAL mode
+
+    Each recipe is stored as JSON, with the fields we filter on copied into
+    indexed columns. Every write also adds a row to a small changes table, so
+    other processes only have to read the recipes that actually changed.
+    """
+
+    KEEP_CHANGES = 10000  # rows of the changes table other processes can catch up from
+
+    def __init__(self, path):
+        self.path = path
+        # one connection shared by all threads, _conn_lock keeps them apart
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn_lock = threading.RLock()
+        self._data_version = None
+        self._seq = None  # last row of the changes table we've seen
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS recipes (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    category TEXT,
+                    difficulty TEXT,
+                    is_favorite INTEGER NOT NULL DEFAULT 0,
+                    prep_time INTEGER,
+                    created_at TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS recipes_category ON recipes (category);
+                CREATE INDEX IF NOT EXISTS recipes_difficulty ON recipes (difficulty);
+                CREATE INDEX IF NOT EXISTS recipes_is_favorite ON recipes (is_favorite);
+                CREATE INDEX IF NOT EXISTS recipes_prep_time ON recipes (prep_time);
+                CREATE TABLE IF NOT EXISTS changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipe_id INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            """)
+
+    def _current_data_version(self):
+        # only changes when another connection commits
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def is_stale(self):
+        with self._conn_lock:
+            return self._seq is None or self._current_data_version() != self._data_version
+
+    def forget(self):
+        """Forget what we've seen, so the next read_changes loads everything again"""
+        self._seq = None
+
+    def position(self):
+        # the inode tells a database that was replaced apart from the one the seq belongs to
+        return ('sqlite', os.path.abspath(self.path), (_stat(self.path) or (None,))[0], self._seq)
+
+    def resume(self, position):
+        """Continue from a position(), catching up from the changes table on the next read"""
+        if position[:3] != ('sqlite', os.path.abspath(self.path), (_stat(self.path) or (None,))[0]):
+            return False
+        self._seq = position[3]
+        self._data_version = None
+        return True
+
+    @contextmanager
+    def lock(self):
+        """Hold SQLite's write lock, so other processes wait for us"""
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def read_changes(self, strict=False):
+        """Return (snapshot, entries) like JsonFileBackend.read_changes"""
+        with self._conn_lock:
+            data_version = self._current_data_version()
+            if self._seq is not None and data_version == self._data_version:
+                return None, []
+            self._data_version = data_version
+
+            last_seq, first_seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0), MIN(seq) FROM changes").fetchone()
+            # (a seq past the end means the table was started over, not that nothing changed)
+            if (self._seq is not None and self._seq <= last_seq
+                    and (first_seq is None or first_seq <= self._seq + 1)):
+                # catch up from the changes table
+                entries = []
+                next_id = self._load_next_id()
+                changed = self._conn.execute(
+                    "SELECT DISTINCT recipe_id FROM changes WHERE seq > ?", (self._seq,)).fetchall()
+                for (recipe_id,) in changed:
+                    row = self._conn.execute(
+                        "SELECT data FROM recipes WHERE id = ?", (recipe_id,)).fetchone()
+                    if row is None:
+                        # the put is gone with the row, this entry has to carry next_id so it isn't reused
+                        entries.append({"op": "delete", "id": recipe_id, "next_id": next_id})
+                    else:
+                        metrics.inc('recipe_storage_bytes_total', len(row[0]), direction='read', backend='sqlite')
+                        entries.append({"op": "put", "recipe": fastjson.loads(row[0]), "next_id": next_id})
+                self._seq = last_seq
+                return None, entries
+
+            # first load, or we fell too far behind
+            rows = self._conn.execute("SELECT data FROM recipes ORDER BY id").fetchall()
+            metrics.inc('recipe_storage_bytes_total', sum(len(data) for (data,) in rows),
+                        direction='read', backend='sqlite')
+            recipes = [fastjson.loads(data) for (data,) in rows]
+            self._seq = last_seq
+            return (recipes, self._load_next_id()), []
+
+    def _load_next_id(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+        return row[0] if row else 1
+
+    def write(self, changes, recipes, next_id):
+        """Apply changes to the database, called inside lock() so they commit together"""
+        with self._conn_lock:
+            for change in changes:
+                if change['op'] == 'put':
+                    recipe = change['recipe']
+                    data = fastjson.dumps(recipe).decode()
+                    metrics.inc('recipe_storage_bytes_total', len(data), direction='write', backend='sqlite')
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO recipes "
+                        "(id, name, category, difficulty, is_favorite, prep_time, created_at, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (recipe['id'], recipe['name'], recipe.get('category'), recipe.get('difficulty'),
+                         bool(recipe.get('is_favorite')), recipe.get('prep_time'),
+                         recipe.get('created_at'), data))
+                    recipe_id = recipe['id']
+                else:
+                    recipe_id = change['id']
+                    self._conn.execute("DELETE FROM recipes WHERE id = ?", (recipe_id,))
+                cursor = self._conn.execute("INSERT INTO changes (recipe_id) VALUES (?)", (recipe_id,))
+                self._seq = cursor.lastrowid
+
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_id', ?)", (next_id,))
+            self._conn.execute("DELETE FROM changes WHERE seq <= ?", (self._seq - self.KEEP_CHANGES,))
+
+    def needs_compaction(self):
+        return False
+
+    def start_compaction(self, recipes, next_id):
+        return None  # SQLite looks after its own files
+
+
+def open_backend(kind, json_path, sqlite_path, journal=False):
+    """Create the backend named by the RECIPE_STORAGE setting"""
+    if kind == 'json':
+        return JsonFileBackend(json_path, journal=journal)
+    if kind == 'sqlite':
+        return SqliteBackend(sqlite_path)
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,629 @@
+import gc
+import hashlib
+import heapq
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+
+import fastjson
+import indexes
+import models
+from indexes import (IngredientIndex, QueryIndex, RecipeStats, SearchIndex, SimilarityIndex, jaccard,
+                     normalize_ingredient, similarity_features)
+from metrics import metrics
+from models import Recipe
+
+# bumped whenever what save_snapshot() writes changes, older snapshot files are then ignored
+SNAPSHOT_FORMAT = 4
+
+
+def _source_hash(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# the snapshot pickles these modules' objects as they are, without running __init__, so one
+# saved by other code (a deploy, or the dev server reloading after an edit) is never loaded
+SNAPSHOT_CODE = _source_hash([indexes.__file__, models.__file__, __file__])
+
+# recipes per pickle in a snapshot file, so saving never needs a second copy of all of them
+SNAPSHOT_CHUNK = 50000
+
+
+class ReadWriteLock:
+    """Lets any number of readers in at once, but gives writers the lock to themselves"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            # waiting writers go first so a steady stream of reads can't starve them
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+@contextmanager
+def _gc_paused():
+    """Keep the cyclic garbage collector from running while lots of objects get made
+
+    None of a freshly loaded set of recipes is garbage, so all the collector
+    would do is walk the same new objects over and over.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class RecipeStore:
+    """Keeps recipes in memory and writes every change through to a storage backend
+
+    Reads are answered from memory. Before each operation the backend is asked
+    whether another process changed the data, and if so those changes are
+    loaded first (see storage.py for the backends). Recipes are held as
+    models.Recipe objects; the log entries handed to the backend hold dicts.
+
+    The last change_log_size changes are also kept in memory, numbered by
+    version, so clients can catch up with changes_since() instead of
+    fetching everything again.
+
+    With a snapshot_path, save_snapshot() pickles the recipes and their
+    indexes together with the backend's position, and the first read after
+    a restart loads that instead of parsing every recipe and rebuilding the
+    indexes. Whatever the backend got since is applied on top as usual, or
+    the snapshot is dropped if the backend can't tell. Only point it at a
+    file nobody else can write, loading a pickle runs whatever it says.
+    """
+
+    def __init__(self, backend, change_log_size=10000, snapshot_path=None):
+        self.backend = backend
+        self.snapshot_path = snapshot_path
+        self._snapshot_version = 0  # the version last loaded from or saved to the snapshot
+        self._started = False  # whether _refresh has run yet, the snapshot is only tried before that
+        self._recipes = {}  # id -> Recipe, in insertion order
+        self._encoded = {}  # id -> the recipe as JSON bytes, filled in as needed
+        self._search_index = SearchIndex()
+        self._query_index = QueryIndex()
+        self._ingredient_index = IngredientIndex()
+        self._similarity_index = SimilarityIndex()
+        self._stats = RecipeStats()
+        self._next_id = 1
+        self._version = 0  # bumped on every change to the in-memory recipes
+        self._modified_at = time.time()
+        self._changes = deque(maxlen=change_log_size)  # (version, recipe id, Recipe or None if deleted)
+        self._changes_start = 0  # changes_since() can answer for any version from here on
+        self._changed = threading.Condition()  # notified after every change, see wait_for_change()
+        self._needs_reload = False
+        self._compacting = False
+        self._lock = ReadWriteLock()
+
+    @contextmanager
+    def _reading(self):
+        """Hold the read lock, loading other processes' changes first if needed"""
+        if self._needs_reload or self.backend.is_stale():
+            with self._lock.write():
+                self._refresh()
+        with self._lock.read():
+            yield
+
+    @contextmanager
+    def _writing(self):
+        """Hold the write lock and the backend's lock, with the latest data loaded"""
+        with self._lock.write(), self.backend.lock():
+            self._refresh(strict=True)
+            try:
+                yield
+            except BaseException:
+                # memory may be ahead of what got saved, start over from the backend
+                self._needs_reload = True
+                raise
+
+    def _refresh(self, strict=False):
+        """Bring the in-memory recipes up to date with the backend"""
+        # a full load makes millions of objects, see _gc_paused()
+        with _gc_paused():
+            if self._needs_reload:
+                self.backend.forget()
+                self._needs_reload = False
+            if not self._started:
+                self._started = True
+                if self.snapshot_path:
+                    self._load_snapshot()
+
+            start = time.perf_counter()
+            snapshot, entries = self.backend.read_changes(strict)
+            if snapshot is not None or entries:
+                # only count reads that found something, most of them are no-op checks
+                kind = 'snapshot' if snapshot is not None else 'incremental'
+                metrics.observe('recipe_storage_seconds', time.perf_counter() - start, op='read')
+                metrics.inc('recipe_storage_operations_total', op='read', kind=kind)
+            if snapshot is not None:
+                recipes, next_id = snapshot
+                self._reset(recipes)
+                self._next_id = max(next_id, max(self._recipes, default=0) + 1)
+            for entry in entries:
+                self._apply(entry)
+
+    def _apply(self, entry):
+        """Apply one log entry to the in-memory recipes"""
+        if entry['op'] == 'put':
+            recipe = Recipe.from_dict(entry['recipe'])
+            self._put(recipe)
+            self._next_id = max(self._next_id, recipe.id + 1, entry.get('next_id', 0))
+        elif entry['op'] == 'delete':
+            self._remove(entry['id'])
+            self._next_id = max(self._next_id, entry['id'] + 1, entry.get('next_id', 0))  # ids are never reused
+
+    # every change to self._recipes goes through these three, so the indexes stay in sync
+
+    def _reset(self, recipes):
+        """Replace everything in memory with a freshly loaded list of recipe dicts"""
+        recipes = {recipe['id']: Recipe.from_dict(recipe) for recipe in recipes}
+        self._replace_all(recipes, SearchIndex(recipes.values()), QueryIndex(recipes.values()),
+                          IngredientIndex(recipes.values()), self._reload_similarity(recipes),
+                          RecipeStats(recipes.values()))
+
+    def _reload_similarity(self, recipes):
+        """Bring the SimilarityIndex in line with a freshly loaded set of recipes
+
+        Hashing a recipe costs much more than building the other indexes do,
+        and a reload mostly brings back the same recipes, so only the ones
+        whose name or ingredients changed are hashed again.
+        """
+        index = self._similarity_index
+        for recipe_id in self._recipes.keys() - recipes.keys():
+            index.remove(recipe_id)
+        for recipe_id, recipe in recipes.items():
+            old = self._recipes.get(recipe_id)
+            if old is None or old.name != recipe.name or old.ingredients != recipe.ingredients:
+                index.add(recipe)
+        return index
+
+    def _replace_all(self, recipes, search_index, query_index, ingredient_index, similarity_index, stats):
+        """Swap in a whole new set of recipes (id -> Recipe) and the indexes built for them"""
+        self._recipes = recipes
+        self._encoded = {}
+        self._search_index = search_index
+        self._query_index = query_index
+        self._ingredient_index = ingredient_index
+        self._similarity_index = similarity_index
+        self._stats = stats
+        self._touch()
+        # anything could have changed, so clients behind this point have to start over
+        self._changes.clear()
+        self._changes_start = self._version
+
+    def _put(self, recipe):
+        """Insert or replace a Recipe in memory"""
+        old = self._recipes.get(recipe.id)
+        self._recipes[recipe.id] = recipe
+        self._encoded.pop(recipe.id, None)
+        self._search_index.add(recipe)
+        self._query_index.add(recipe)
+        self._ingredient_index.add(recipe)
+        if old is None or old.name != recipe.name or old.ingredients != recipe.ingredients:
+            self._similarity_index.add(recipe)  # hashing is the slow part, favorites and edits often skip it
+        self._stats.add(recipe)
+        self._touch()
+        self._log_change(recipe.id, recipe)
+
+    def _remove(self, recipe_id):
+        """Remove a recipe from memory, returning it or None if it wasn't there"""
+        recipe = self._recipes.pop(recipe_id, None)
+        self._encoded.pop(recipe_id, None)
+        if recipe is not None:
+            self._search_index.remove(recipe_id)
+            self._query_index.remove(recipe_id)
+            self._ingredient_index.remove(recipe_id)
+            self._similarity_index.remove(recipe_id)
+            self._stats.remove(recipe_id)
+            self._touch()
+            self._log_change(recipe_id, None)
+        return recipe
+
+    def _encode(self, recipe):
+        """Return the recipe as JSON bytes, encoding it only the first time"""
+        data = self._encoded.get(recipe.id)
+        if data is None:
+            # readers may race to fill this in, they all store the same bytes
+            data = self._encoded[recipe.id] = fastjson.dumps(recipe.to_dict())
+        return data
+
+    def _encode_all(self, recipes):
+        """Encode recipes for a response, timed with the rest of the API's JSON work"""
+        with metrics.timer('recipe_json_seconds', op='serialize'):
+            return [self._encode(recipe) for recipe in recipes]
+
+    def _touch(self):
+        self._version += 1
+        self._modified_at = time.time()
+        with self._changed:
+            self._changed.notify_all()
+
+    def _log_change(self, recipe_id, recipe):
+        if len(self._changes) == self._changes.maxlen:
+            # the oldest change is about to fall off the end
+            self._changes_start = self._changes[0][0]
+        self._changes.append((self._version, recipe_id, recipe))
+
+    def _load_snapshot(self):
+        """Restore memory and the backend's position from snapshot_path, returns False if it can't be used"""
+        start = time.perf_counter()
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                header = pickle.load(f)
+                if header.get('format') != SNAPSHOT_FORMAT or header.get('code') != SNAPSHOT_CODE:
+                    return False
+                if not self.backend.resume(header['position']):
+                    return False
+                recipes = {}
+                while len(recipes) < header['count']:
+                    for recipe in pickle.load(f):
+                        recipes[recipe.id] = recipe
+                indexes = [pickle.load(f) for _ in range(5)]
+        except FileNotFoundError:
+            return False
+        except Exception:
+            # cut off or from an older version of the code, the backend has everything anyway
+            self.backend.forget()
+            return False
+
+        self._replace_all(recipes, *indexes)
+        self._next_id = header['next_id']
+        self._changes.clear()
+        self._changes_start = self._version
+        self._snapshot_version = self._version
+        metrics.observe('recipe_storage_seconds', time.perf_counter() - start, op='load_snapshot')
+        return True
+
+    def save_snapshot(self):
+        """Pickle the recipes and indexes to snapshot_path, for the next start to load
+
+        Does nothing (and returns False) if nothing changed since the snapshot
+        was last loaded or saved, or if the store was never even read.
+        """
+        if not self.snapshot_path or self._version == self._snapshot_version:
+            return False
+        with self._reading():
+            if self._version == self._snapshot_version:
+                return False
+            start = time.perf_counter()
+            header = {'format': SNAPSHOT_FORMAT, 'code': SNAPSHOT_CODE, 'position': self.backend.position(),
+                      'next_id': self._next_id, 'count': len(self._recipes)}
+            folder = os.path.dirname(os.path.abspath(self.snapshot_path))
+            fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.snapshot_path) + '.',
+                                            suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+                    recipes = iter(self._recipes.values())
+                    for chunk in iter(lambda: list(islice(recipes, SNAPSHOT_CHUNK)), []):
+                        pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                    # one pickle each, so the pickler only remembers one index's objects at a time
+                    for index in (self._search_index, self._query_index, self._ingredient_index,
+                                  self._similarity_index, self._stats):
+                        pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.snapshot_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            self._snapshot_version = self._version
+        metrics.observe('recipe_storage_seconds', time.perf_counter() - start, op='save_snapshot')
+        return True
+
+    def _persist(self, changes):
+        """Hand a list of log entries to the backend"""
+        with metrics.timer('recipe_storage_seconds', op='write'):
+            self.backend.write(changes, map(self._encode, self._recipes.values()), self._next_id)
+        metrics.inc('recipe_storage_operations_total', op='write', kind='changes')
+        if self.backend.needs_compaction() and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            self._compacting = False
+
+    def compact(self):
+        """Let the backend fold its log into a fresh snapshot, if it keeps one"""
+        with self._writing():
+            job = self.backend.start_compaction(list(map(self._encode, self._recipes.values())), self._next_id)
+        if job is None:
+            return
+
+        # the slow part happens without holding any lock
+        with metrics.timer('recipe_storage_seconds', op='compact'):
+            self.backend.write_compaction(job)
+        with self._writing():
+            self.backend.finish_compaction(job)
+
+    def version_info(self):
+        """Return (version, modified_at), the version changes whenever any recipe does"""
+        with self._reading():
+            return self._version, self._modified_at
+
+    def changes_since(self, version):
+        """Return (current version, changes made after version), oldest first
+
+        Each change is (version, recipe id, Recipe or None if it was deleted).
+        The changes are None if the log doesn't go back that far (or version
+        is from the future), then the only way to catch up is to fetch everything.
+        """
+        with self._reading():
+            if not self._changes_start <= version <= self._version:
+                return self._version, None
+            changes = []
+            for change in reversed(self._changes):
+                if change[0] <= version:
+                    break
+                changes.append(change)
+            changes.reverse()
+            return self._version, changes
+
+    def wait_for_change(self, version, timeout):
+        """Wait up to timeout seconds for the version to move past version
+
+        Changes made by other processes only show up once something reads the
+        store, so callers should check changes_since() after every wait.
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self._version != version, timeout)
+
+    def stats(self):
+        """Return the total, average prep time, most common category and favorite count"""
+        with self._reading():
+            return self._stats.summary()
+
+    def next_id(self):
+        """Return the id the next added recipe will get"""
+        with self._reading():
+            return self._next_id
+
+    def all(self):
+        """Return a list of all recipes"""
+        with self._reading():
+            return list(self._recipes.values())
+
+    def query(self, equals=None, ranges=None, sort=None, descending=False, offset=0, limit=None,
+              encoded=False):
+        """Return (recipes, total count) for one page of filtered and sorted recipes
+
+        See QueryIndex.query for the filter and sort arguments. With none of
+        them this is just a slice of all recipes in insertion order. With
+        encoded, the recipes come back as JSON bytes (see fastjson.join_array).
+        """
+        stop = None if limit is None else offset + limit
+        with self._reading():
+            page = self._query_index.query(equals, ranges, sort, descending, offset, limit)
+            if page is None:
+                recipes, total = list(islice(self._recipes.values(), offset, stop)), len(self._recipes)
+            else:
+                ids, total = page
+                recipes = [self._recipes[recipe_id] for recipe_id in ids]
+            if encoded:
+                recipes = self._encode_all(recipes)
+            return recipes, total
+
+    def get(self, recipe_id, encoded=False):
+        """Return the recipe with this id (as JSON bytes with encoded), or None"""
+        with self._reading():
+            recipe = self._recipes.get(recipe_id)
+            if recipe is not None and encoded:
+                return self._encode_all([recipe])[0]
+            return recipe
+
+    # the _add/_update/_delete/_toggle_favorite helpers change memory and return
+    # (result, log entry), the public methods below save the entries
+
+    def _add(self, fields):
+        new_id = self._next_id
+        self._next_id += 1
+
+        recipe = Recipe.from_dict(dict(fields, id=new_id))
+        self._put(recipe)
+        return recipe, {"op": "put", "recipe": recipe.to_dict(), "next_id": self._next_id}
+
+    def _update(self, recipe_id, fields):
+        recipe = self._recipes.get(recipe_id)
+        if recipe is None:
+            return None, None
+
+        updated = dict(fields, id=recipe_id)
+        if recipe.created_at:
+            updated['created_at'] = recipe.created_at  # keep original date
+        updated = Recipe.from_dict(updated)
+        self._put(updated)
+        return updated, {"op": "put", "recipe": updated.to_dict()}
+
+    def _delete(self, recipe_id):
+        if self._remove(recipe_id) is None:
+            return None, None
+        return True, {"op": "delete", "id": recipe_id}
+
+    def _toggle_favorite(self, recipe_id):
+        recipe = self._recipes.get(recipe_id)
+        if recipe is None:
+            return None, None
+
+        updated = recipe.replace(is_favorite=not recipe.is_favorite)
+        self._put(updated)
+        return updated, {"op": "put", "recipe": updated.to_dict()}
+
+    def add(self, fields):
+        """Add a new recipe and return it with its generated id"""
+        with self._writing():
+            recipe, change = self._add(fields)
+            self._persist([change])
+            return recipe
+
+    def add_many(self, fields_list):
+        """Add several recipes with consecutive ids, saved in one step. Returns the new recipes"""
+        if not fields_list:
+            return []
+        with self._writing():
+            added = [self._add(fields) for fields in fields_list]
+            self._persist([change for _, change in added])
+            return [recipe for recipe, _ in added]
+
+    def seed_if_empty(self, fields_list):
+        """Add recipes only if none was ever added, checked under the write lock so only one process does
+
+        Returns the new recipes, or [] if the store had been used already.
+        """
+        if self.next_id() != 1:
+            return []  # the usual case, no need to lock anything
+        with self._writing():
+            if self._next_id != 1:
+                return []
+            added = [self._add(fields) for fields in fields_list]
+            self._persist([change for _, change in added])
+            return [recipe for recipe, _ in added]
+
+    def update(self, recipe_id, fields):
+        """Replace a recipe's fields, keeping its id and created_at. Returns None if not found"""
+        with self._writing():
+            updated, change = self._update(recipe_id, fields)
+            if change:
+                self._persist([change])
+            return updated
+
+    def delete(self, recipe_id):
+        """Delete a recipe. Returns False if it wasn't found"""
+        with self._writing():
+            deleted, change = self._delete(recipe_id)
+            if change:
+                self._persist([change])
+            return bool(deleted)
+
+    def toggle_favorite(self, recipe_id):
+        """Flip is_favorite on a recipe and return it, or None if not found"""
+        with self._writing():
+            updated, change = self._toggle_favorite(recipe_id)
+            if change:
+                self._persist([change])
+            return updated
+
+    def apply_batch(self, operations):
+        """Apply ('update', id, fields), ('delete', id, None) and ('favorite', id, None) operations
+
+        Everything is saved in one step. Returns one result per operation:
+        the updated recipe, True for a delete, or None if the recipe wasn't found.
+        """
+        if not operations:
+            return []
+        with self._writing():
+            results = []
+            changes = []
+            for op, recipe_id, fields in operations:
+                if op == 'update':
+                    result, change = self._update(recipe_id, fields)
+                elif op == 'delete':
+                    result, change = self._delete(recipe_id)
+                else:
+                    result, change = self._toggle_favorite(recipe_id)
+                results.append(result)
+                if change:
+                    changes.append(change)
+            if changes:
+                self._persist(changes)
+            return results
+
+    def search(self, query, encoded=False):
+        """Return recipes with a name or ingredient word starting with any query word
+
+        Recipes that match more of the query words come first. With encoded,
+        they come back as JSON bytes.
+        """
+        with self._reading():
+            recipes = [self._recipes[recipe_id] for recipe_id in self._search_index.search(query)]
+            if encoded:
+                recipes = self._encode_all(recipes)
+            return recipes
+
+    def suggest(self, text, limit=10):
+        """Return {'id', 'name'} for up to limit recipes whose words start with what's been typed"""
+        with self._reading():
+            return [{'id': recipe_id, 'name': self._recipes[recipe_id]['name']}
+                    for recipe_id in self._search_index.suggest(text, limit)]
+
+    def similar(self, recipe_id, limit=10, min_similarity=0.0):
+        """Return recipes like this one as {'recipe', 'similarity'}, most similar first, or None if not found
+
+        Only near matches are found (see SimilarityIndex); similarity is the
+        exact Jaccard similarity of the two recipes' ingredients and name words.
+        """
+        with self._reading():
+            recipe = self._recipes.get(recipe_id)
+            if recipe is None:
+                return None
+            features = similarity_features(recipe)
+            scored = []
+            for other_id in self._similarity_index.candidates(recipe_id, min_similarity):
+                similarity = jaccard(features, similarity_features(self._recipes[other_id]))
+                if similarity >= min_similarity:
+                    scored.append((-similarity, other_id))
+            return [{'recipe': self._recipes[other_id], 'similarity': -negative}
+                    for negative, other_id in heapq.nsmallest(limit, scored)]
+
+    def match(self, pantry, rank_by='coverage', max_missing=None, limit=None):
+        """Return recipes that can be made (or nearly) from a list of ingredients
+
+        Each result is {'recipe', 'coverage', 'matched', 'missing'} where
+        missing lists the recipe's own ingredients that aren't in the pantry.
+        See IngredientIndex.match for the ranking.
+        """
+        have = set(map(normalize_ingredient, pantry))
+        have.add('')  # headings like "For the gravy" aren't missing
+        with self._reading():
+            results = []
+            for recipe_id, count, total in self._ingredient_index.match(pantry, rank_by, max_missing, limit):
+                recipe = self._recipes[recipe_id]
+                results.append({
+                    'recipe': recipe,
+                    'coverage': count / total,
+                    'matched': count,
+                    'missing': [ingredient for ingredient in recipe.ingredients
+                                if normalize_ingredient(ingredient) not in have],
+                })
+            return results
@@ -0,0 +1,23 @@
+import pytest
+
+from cache import ResponseCache
+from storage import JsonFileBackend
+from store import RecipeStore
+from youtube import ThumbnailCache
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A test client for app.py with its own store, seeded with the sample recipes
+
+    Nothing is downloaded: the thumbnail cache's fetcher finds no videos.
+    """
+    monkeypatch.chdir(tmp_path)  # in case importing app writes anything
+    import app
+
+    monkeypatch.setattr(app, 'store', RecipeStore(JsonFileBackend(str(tmp_path / 'recipes.json')),
+                                                  change_log_size=5))
+    monkeypatch.setattr(app, 'response_cache', ResponseCache())
+    monkeypatch.setattr(app, 'thumbnails', ThumbnailCache(str(tmp_path / 'thumbnails'), fetcher=lambda video: None))
+    app.start_up()
+    return app.app.test_client()
@@ -0,0 +1,75 @@
+import json
+
+RECIPE = {'name': 'Tomato Soup', 'ingredients': ['4 large tomatoes, chopped', 'salt', '1 cup cream']}
+
+
+def first_event(response):
+    """The data of the first event in a text/event-stream response"""
+    text = ''
+    for chunk in response.response:
+        text += chunk.decode()
+        if '\ndata: ' in text and text.endswith('\n\n'):
+            break
+    response.close()
+    return json.loads(text.split('\ndata: ', 1)[1])
+
+
+def test_match_sample_recipes(client):
+    matches = client.post('/recipes/match', json={'ingredients': ['Pasta', 'eggs', 'bacon']}).get_json()
+    assert matches[0]['recipe']['name'] == 'Pasta Carbonara'
+    assert matches[0]['matched'] == 3
+    assert matches[0]['missing'] == ['cheese', 'pepper']
+
+
+def test_change_feed_lists_changes_then_resets(client):
+    since = client.get('/recipes').headers['ETag'].strip('"')
+    client.put('/recipes/1/favorite')
+    client.delete('/recipes/2')
+
+    feed = client.get('/recipes/changes', query_string={'since': since}).get_json()
+    assert not feed['reset']
+    assert [(change['op'], change['id']) for change in feed['changes']] == [('put', 1), ('delete', 2)]
+    assert feed['changes'][0]['recipe']['is_favorite'] is False
+
+    for _ in range(5):  # more than the store's change log keeps
+        client.put('/recipes/1/favorite')
+    feed = client.get('/recipes/changes', query_string={'since': since}).get_json()
+    assert feed['reset'] and feed['changes'] == []
+
+    assert client.get('/recipes/changes', query_string={'since': 'another-worker-3'}).get_json()['reset']
+
+
+def test_change_stream_replays_missed_changes(client):
+    since = client.get('/recipes').headers['ETag'].strip('"')
+    client.post('/recipes', json=RECIPE)
+
+    response = client.get('/recipes/changes/stream', query_string={'since': since}, buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    event = first_event(response)
+    assert [change['recipe']['name'] for change in event['changes']] == ['Tomato Soup']
+
+
+def test_bulk_adds_valid_recipes_and_reports_the_rest(client):
+    response = client.post('/recipes/bulk', json=[RECIPE, {'name': 'No ingredients'}, RECIPE])
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['ids'] == [3, 4]
+    assert body['errors'] == [{'index': 1, 'error': 'Ingredients are required'}]
+    assert {duplicate['id'] for duplicate in body['possible_duplicates']} == {3, 4}  # each other's
+
+
+def test_batch_rejects_boolean_ids(client):
+    body = client.post('/recipes/batch', json=[{'op': 'favorite', 'id': True},
+                                               {'op': 'delete', 'id': 2}]).get_json()
+    assert body['applied'] == 1
+    assert body['errors'] == [{'index': 0, 'error': 'id must be a number'}]
+    assert client.get('/recipes/1').get_json()['is_favorite'] is True
+
+
+def test_similar_finds_near_duplicates(client):
+    first = client.post('/recipes', json=RECIPE).get_json()
+    second = client.post('/recipes', json=dict(RECIPE, ingredients=RECIPE['ingredients'] + ['pepper'])).get_json()
+    assert [match['id'] for match in second['possible_duplicates']] == [first['id']]
+
+    similar = client.get(f"/recipes/{first['id']}/similar").get_json()
+    assert similar[0]['recipe']['id'] == second['id']
@@ -0,0 +1,35 @@
+import os
+import shutil
+
+from indexes import normalize_ingredient
+from storage import JsonFileBackend
+from store import RecipeStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shipped_store(tmp_path):
+    """A store on a copy of the recipes.json that ships with the repo"""
+    shutil.copy(os.path.join(ROOT, 'recipes.json'), tmp_path / 'recipes.json')
+    return RecipeStore(JsonFileBackend(str(tmp_path / 'recipes.json')))
+
+
+def test_normalize_ingredient_drops_amounts_and_notes():
+    assert normalize_ingredient('2 large Tomatoes, chopped') == 'tomato'
+    assert normalize_ingredient('10 cups (2 litres) milk') == 'milk'
+    assert normalize_ingredient('3/5 cup (150 gms) sugar') == 'sugar'
+    assert normalize_ingredient('Salt to taste') == 'salt'
+    assert normalize_ingredient('Oil for deep frying') == 'oil'
+    assert normalize_ingredient('For Gravy') == ''
+
+
+def test_match_pantry_against_shipped_recipes(tmp_path):
+    store = shipped_store(tmp_path)
+    matches = store.match(['paneer', 'salt', 'onion', 'tomato', 'oil', 'ginger'])
+    assert {match['recipe'].name for match in matches} == {'Kadhai Panner', 'Malai Kofta'}
+    assert all(match['matched'] == 6 for match in matches)
+    assert not any(line.startswith('For ') for match in matches for line in match['missing'])
+
+    matches = store.match(['milk', 'sugar'])
+    assert [match['recipe'].name for match in matches] == ['Milk Cake']
+    assert matches[0]['matched'] == 2
@@ -0,0 +1,64 @@
+import pytest
+
+from storage import JsonFileBackend, SqliteBackend
+from store import RecipeStore
+
+BACKENDS = {
+    'json': lambda folder: JsonFileBackend(str(folder / 'recipes.json')),
+    'journal': lambda folder: JsonFileBackend(str(folder / 'recipes.json'), journal=True),
+    'sqlite': lambda folder: SqliteBackend(str(folder / 'recipes.db')),
+}
+
+
+def recipe(name):
+    return {'name': name, 'ingredients': ['salt']}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def two_stores(request, tmp_path):
+    """Two stores on the same files, like two worker processes"""
+    make = BACKENDS[request.param]
+    return RecipeStore(make(tmp_path)), RecipeStore(make(tmp_path))
+
+
+def test_ids_are_not_reused_after_another_store_deletes(two_stores):
+    first, second = two_stores
+    assert first.add(recipe('a')).id == 1
+    assert second.next_id() == 2  # caught up
+
+    added = first.add(recipe('b'))
+    first.delete(added.id)
+    assert second.add(recipe('c')).id == added.id + 1
+    assert first.add(recipe('d')).id == added.id + 2
+
+
+def test_seed_if_empty_adds_once(two_stores):
+    first, second = two_stores
+    assert [added.id for added in first.seed_if_empty([recipe('a'), recipe('b')])] == [1, 2]
+    assert second.seed_if_empty([recipe('a'), recipe('b')]) == []
+
+    first.delete(1)
+    first.delete(2)
+    assert second.seed_if_empty([recipe('a')]) == []  # emptied isn't the same as never used
+
+
+def test_snapshot_round_trip(tmp_path):
+    def make():
+        return RecipeStore(JsonFileBackend(str(tmp_path / 'recipes.json')), snapshot_path=str(tmp_path / 'snapshot'))
+
+    store = make()
+    store.add_many([recipe('Tomato soup'), {'name': 'Pasta', 'ingredients': ['pasta', 'salt'], 'prep_time': 20}])
+    store.delete(1)
+    store.add({'name': 'Tomato soup', 'ingredients': ['2 tomatoes, chopped', 'salt', 'cream']})
+    assert store.save_snapshot()
+
+    other = RecipeStore(JsonFileBackend(str(tmp_path / 'recipes.json')))
+    other.add(recipe('Added while stopped'))  # loaded on top of the snapshot
+
+    loaded = make()
+    assert [r.to_dict() for r in loaded.all()] == [r.to_dict() for r in other.all()]
+    assert loaded._snapshot_version  # came from the snapshot, not a full load
+    assert loaded.next_id() == 5
+    assert [r.name for r in loaded.search('tomato')] == ['Tomato soup']
+    assert [match['recipe'].id for match in loaded.match(['tomato', 'salt', 'cream'])][0] == 3
+    assert loaded.query(sort='prep_time', descending=True, limit=1)[0][0].name == 'Pasta'
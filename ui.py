@@ -1,40 +1,36 @@
 import streamlit as st
-import requests
-import pandas as pd
-import json
-import re
+from api_client import RecipeClient
+from youtube import video_id as parse_video_id
 
 # API base URL
 API_URL = "http://localhost:5000"
 
+# seconds to wait for the API (connect, read)
+API_TIMEOUT = (3.05, 10)
+
+# GET responses younger than this are reused without asking the API again
+CACHE_TTL = 1.0
+
+# search results and suggestions are memoized per query for this long (seconds)
+SEARCH_CACHE_TTL = 60
+SUGGESTION_COUNT = 5
+
+# thumbnails come from the API's cache (never straight from YouTube), memoized per video
+THUMBNAIL_CACHE_SIZE = 200
+
+# recipes shown per page; the list only fetches what the collapsed rows show,
+# the rest of a recipe is fetched when it's opened
+PAGE_SIZE = 20
+SUMMARY_FIELDS = ['name', 'difficulty', 'prep_time', 'category', 'is_favorite']
+
 st.set_page_config(
     page_title="Recipe Manager",
     page_icon="🍳",
     layout="wide"
 )
 
-def extract_youtube_id(url):
-    """Extract YouTube video ID from URL"""
-    if not url:
-        return None
-    
-    # handle different yt formats
-    patterns = [
-        r'youtube\.com/watch\?v=([^&]+)',
-        r'youtu\.be/([^?]+)',
-        r'youtube\.com/embed/([^?]+)',
-        r'youtube\.com/v/([^?]+)'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
-def embed_youtube_video(youtube_url, width=560, height=315):
+def embed_youtube_video(video_id, width=560, height=315):
     """Create YouTube embed HTML"""
-    video_id = extract_youtube_id(youtube_url)
     if not video_id:
         return None
     
@@ -52,69 +48,118 @@ def embed_youtube_video(youtube_url, width=560, height=315):
     """
     return embed_html
 
-def get_all_recipes():
-    """Fetch all recipes from API"""
+@st.cache_resource
+def get_client():
+    """One pooled API client shared by every session and rerun, kept current by the API's change stream"""
+    client = RecipeClient(API_URL, timeout=API_TIMEOUT, ttl=CACHE_TTL)
+    client.follow()
+    return client
+
+def get_recipe_page(offset):
+    """Fetch one page of recipe summaries from API, returns (recipes, total)"""
     try:
-        response = requests.get(f"{API_URL}/recipes")
-        if response.status_code == 200:
-            return response.json()
-        return []
+        return get_client().list_page(offset, PAGE_SIZE, SUMMARY_FIELDS)
     except:
         st.error("Could not connect to API. Make sure Flask app is running!")
-        return []
+        return [], 0
 
 def get_recipe(recipe_id):
     """Fetch single recipe from API"""
     try:
-        response = requests.get(f"{API_URL}/recipes/{recipe_id}")
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return get_client().get_recipe(recipe_id)
     except:
         return None
 
 def add_recipe(recipe_data):
     """Add new recipe via API"""
     try:
-        response = requests.post(f"{API_URL}/recipes", json=recipe_data)
-        return response.status_code == 201
+        changed = get_client().add_recipe(recipe_data)
+        forget_searches()
+        return changed
     except:
         return False
 
 def edit_recipe(recipe_id, recipe_data):
     """Edit existing recipe via API"""
     try:
-        response = requests.put(f"{API_URL}/recipes/{recipe_id}", json=recipe_data)
-        return response.status_code == 200
+        changed = get_client().edit_recipe(recipe_id, recipe_data)
+        forget_searches()
+        return changed
     except:
         return False
 
 def delete_recipe(recipe_id):
     """Delete recipe via API"""
     try:
-        response = requests.delete(f"{API_URL}/recipes/{recipe_id}")
-        return response.status_code == 200
+        changed = get_client().delete_recipe(recipe_id)
+        forget_searches()
+        return changed
     except:
         return False
 
+# memoized per query and data version (so anyone's change makes them stale), and
+# cleared whenever we change something; failures raise, so they aren't memoized
+@st.cache_data(ttl=SEARCH_CACHE_TTL, max_entries=500)
+def fetch_search(query, version):
+    return get_client().search_recipes(query)
+
+@st.cache_data(ttl=SEARCH_CACHE_TTL, max_entries=500)
+def fetch_suggestions(prefix, version):
+    return get_client().suggest(prefix, SUGGESTION_COUNT)
+
+def forget_searches():
+    """Drop memoized search results after a change"""
+    fetch_search.clear()
+    fetch_suggestions.clear()
+
 def search_recipes(query):
     """Search recipes via API"""
     try:
-        response = requests.get(f"{API_URL}/recipes/search", params={"q": query})
-        if response.status_code == 200:
-            return response.json()
+        return fetch_search(query, get_client().data_version)
+    except:
         return []
+
+def suggest_recipes(prefix):
+    """Fetch type-ahead suggestions (ids and names only) via API"""
+    try:
+        return fetch_suggestions(prefix, get_client().data_version)
     except:
         return []
 
+@st.cache_data(max_entries=THUMBNAIL_CACHE_SIZE)
+def fetch_thumbnail(video_id):
+    thumbnail = get_client().thumbnail(video_id)
+    if thumbnail is None:
+        raise LookupError(video_id)  # not memoized, the API may have it next time
+    return thumbnail
+
+def get_thumbnail(video_id):
+    """Fetch a video's thumbnail image from the API, None if it's not available"""
+    try:
+        return fetch_thumbnail(video_id)
+    except:
+        return None
+
+def use_suggestion(name):
+    """Put a clicked suggestion into the search box"""
+    st.session_state.search_query = name
+
 def toggle_favorite(recipe_id):
     """Toggle favorite status via API"""
     try:
-        response = requests.put(f"{API_URL}/recipes/{recipe_id}/favorite")
-        return response.status_code == 200
+        changed = get_client().toggle_favorite(recipe_id)
+        forget_searches()
+        return changed
     except:
         return False
 
+def get_stats():
+    """Fetch recipe stats from API"""
+    try:
+        return get_client().get_stats()
+    except:
+        return None
+
 def show_recipe_form(recipe=None, form_key="add"):
     """Show recipe form for adding or editing"""
     form_title = "✏️ Edit Recipe" if recipe else "➕ Add New Recipe"
@@ -154,12 +199,13 @@ def show_recipe_form(recipe=None, form_key="add"):
         
         # yt video preview
         if youtube_url:
-            video_id = extract_youtube_id(youtube_url)
+            video_id = parse_video_id(youtube_url)
             if video_id:
                 st.success("✅ Valid YouTube URL detected!")
                 #thumbnail preview
-                thumbnail_url = f"https://img.youtube.com/vi/{video_id}/mqdefault.jpg"
-                st.image(thumbnail_url, width=200, caption="Video Preview")
+                thumbnail = get_thumbnail(video_id)
+                if thumbnail:
+                    st.image(thumbnail, width=200, caption="Video Preview")
             else:
                 st.warning("⚠️ Invalid YouTube URL format")
         
@@ -199,11 +245,76 @@ def show_recipe_form(recipe=None, form_key="add"):
         
         return False  
 
+def reset_page():
+    st.session_state.page = 0
+
+def show_recipe_details(recipe):
+    """Everything inside an opened recipe: fetched and built only once it's opened"""
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        st.write("**Ingredients:**")
+        for ingredient in recipe['ingredients']:
+            st.write(f"• {ingredient}")
+        
+        if recipe['instructions']:
+            st.write("**Instructions:**")
+            st.write(recipe['instructions'])
+        
+        # yt video
+        if recipe.get('youtube_url'):
+            st.write("**Video Tutorial:**")
+            
+            # viewing options
+            tab1, tab2 = st.tabs(["🎥 Watch Video", "🔗 Open in YouTube"])
+            
+            with tab1:
+                #video player
+                embed_html = embed_youtube_video(recipe.get('youtube_id'), width=500, height=280)
+                if embed_html:
+                    st.components.v1.html(embed_html, height=300)
+                else:
+                    st.error("Invalid YouTube URL format")
+            
+            with tab2:
+                st.write(f"[🎥 Open in YouTube]({recipe['youtube_url']})")
+                #thumbnail
+                thumbnail = get_thumbnail(recipe['youtube_id']) if recipe.get('youtube_id') else None
+                if thumbnail:
+                    st.image(thumbnail, width=300)
+        
+        st.write(f"**Created:** {recipe['created_at']}")
+    
+    with col2:
+        # edit
+        if st.button(f"✏️ Edit", key=f"edit_{recipe['id']}"):
+            st.session_state.edit_mode = True
+            st.session_state.edit_recipe_id = recipe['id']
+            st.rerun()
+        
+        #favourite
+        fav_text = "💔 Unfavorite" if recipe.get('is_favorite', False) else "❤️ Favorite"
+        if st.button(fav_text, key=f"fav_{recipe['id']}"):
+            if toggle_favorite(recipe['id']):
+                st.success("Updated!")
+                st.rerun()
+            else:
+                st.error("Failed to update!")
+        
+        if st.button(f"🗑️ Delete", key=f"delete_{recipe['id']}"):
+            if delete_recipe(recipe['id']):
+                st.success("Recipe deleted!")
+                st.rerun()
+            else:
+                st.error("Failed to delete recipe!")
+
 # initialize session state for edit mode
 if 'edit_mode' not in st.session_state:
     st.session_state.edit_mode = False
 if 'edit_recipe_id' not in st.session_state:
     st.session_state.edit_recipe_id = None
+if 'page' not in st.session_state:
+    st.session_state.page = 0
 
 # Main app
 st.title("🍳 Personal Recipe Manager")
@@ -241,139 +352,92 @@ col1, col2 = st.columns([3, 1])
 
 with col2:
     st.subheader("🔍 Search")
-    search_query = st.text_input("Search recipes...", placeholder="pasta, chicken, etc.")
+    search_query = st.text_input("Search recipes...", placeholder="pasta, chicken, etc.", key="search_query")
+    
+    #suggestions (only ids and names, so they're cheap to fetch on every rerun)
+    if search_query:
+        for suggestion in suggest_recipes(search_query.lower()):
+            if suggestion['name'] != search_query:
+                st.button(suggestion['name'], key=f"suggest_{suggestion['id']}",
+                          on_click=use_suggestion, args=(suggestion['name'],))
+
+# go back to the first page whenever the search changes
+if st.session_state.get('last_search') != search_query:
+    st.session_state.last_search = search_query
+    reset_page()
 
-# get recipes
+# get one page of recipes
+offset = st.session_state.page * PAGE_SIZE
 if search_query:
-    recipes = search_recipes(search_query)
+    results = search_recipes(search_query.lower())
+    recipes, total = results[offset:offset + PAGE_SIZE], len(results)
     st.subheader(f"Search Results for '{search_query}'")
 else:
-    recipes = get_all_recipes()
+    recipes, total = get_recipe_page(offset)
     st.subheader("All Recipes")
 
+if not recipes and st.session_state.page > 0:
+    # the page we were on is gone (e.g. its last recipe was deleted)
+    reset_page()
+    st.rerun()
+
 if not recipes:
     if search_query:
         st.info("No recipes found matching your search.")
     else:
         st.info("No recipes yet. Add your first recipe using the sidebar!")
 else:
-    # show recipes
+    # show recipes, collapsed rows are just a title and a toggle
     for recipe in recipes:
         fav_icon = "⭐" if recipe.get('is_favorite', False) else "☆"
         recipe_title = f"{fav_icon} {recipe['name']} ({recipe['difficulty']}) - {recipe['prep_time']} min - {recipe.get('category', 'Main Course')}"
         
-        with st.expander(recipe_title):
-            col1, col2 = st.columns([3, 1])
-            
-            with col1:
-                st.write("**Ingredients:**")
-                for ingredient in recipe['ingredients']:
-                    st.write(f"• {ingredient}")
-                
-                if recipe['instructions']:
-                    st.write("**Instructions:**")
-                    st.write(recipe['instructions'])
-                
-                # yt video
-                if recipe.get('youtube_url'):
-                    st.write("**Video Tutorial:**")
-                    
-                    # viewing options
-                    tab1, tab2 = st.tabs(["🎥 Watch Video", "🔗 Open in YouTube"])
-                    
-                    with tab1:
-                        #video player
-                        embed_html = embed_youtube_video(recipe['youtube_url'], width=500, height=280)
-                        if embed_html:
-                            st.components.v1.html(embed_html, height=300)
-                        else:
-                            st.error("Invalid YouTube URL format")
-                    
-                    with tab2:
-                        st.write(f"[🎥 Open in YouTube]({recipe['youtube_url']})")
-                        #thumbnail
-                        video_id = extract_youtube_id(recipe['youtube_url'])
-                        if video_id:
-                            thumbnail_url = f"https://img.youtube.com/vi/{video_id}/mqdefault.jpg"
-                            st.image(thumbnail_url, width=300)
-                
-                st.write(f"**Created:** {recipe['created_at']}")
-            
-            with col2:
-                # edit
-                if st.button(f"✏️ Edit", key=f"edit_{recipe['id']}"):
-                    st.session_state.edit_mode = True
-                    st.session_state.edit_recipe_id = recipe['id']
-                    st.rerun()
-                
-                #favourite
-                fav_text = "💔 Unfavorite" if recipe.get('is_favorite', False) else "❤️ Favorite"
-                if st.button(fav_text, key=f"fav_{recipe['id']}"):
-                    if toggle_favorite(recipe['id']):
-                        st.success("Updated!")
-                        st.rerun()
-                    else:
-                        st.error("Failed to update!")
-                
-                if st.button(f"🗑️ Delete", key=f"delete_{recipe['id']}"):
-                    if delete_recipe(recipe['id']):
-                        st.success("Recipe deleted!")
-                        st.rerun()
-                    else:
-                        st.error("Failed to delete recipe!")
+        with st.container(border=True):
+            if st.toggle(recipe_title, key=f"open_{recipe['id']}"):
+                details = get_recipe(recipe['id'])
+                if details:
+                    show_recipe_details(details)
+                else:
+                    st.error("Recipe not found!")
+    
+    # pager
+    page_count = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        if st.button("⬅️ Previous", disabled=st.session_state.page == 0):
+            st.session_state.page -= 1
+            st.rerun()
+    with info_col:
+        st.write(f"Page {st.session_state.page + 1} of {page_count} ({total} recipes)")
+    with next_col:
+        if st.button("Next ➡️", disabled=st.session_state.page + 1 >= page_count):
+            st.session_state.page += 1
+            st.rerun()
 
-#stats
-if recipes:
+#stats (worked out by the API, so we don't need every recipe here)
+stats = get_stats()
+if stats and stats['total_recipes']:
     st.subheader("📊 Recipe Stats")
     
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Recipes", len(recipes))
+        st.metric("Total Recipes", stats['total_recipes'])
     
     with col2:
-        avg_prep = sum(r['prep_time'] for r in recipes) / len(recipes)
-        st.metric("Avg Prep Time", f"{avg_prep:.0f} min")
+        st.metric("Avg Prep Time", f"{stats['average_prep_time']:.0f} min")
     
     with col3:
-        category_counts = {}
-        for recipe in recipes:
-            cat = recipe.get('category', 'Main Course')
-            category_counts[cat] = category_counts.get(cat, 0) + 1
-        most_common_cat = max(category_counts, key=category_counts.get)
-        st.metric("Most Common", most_common_cat)
+        st.metric("Most Common", stats['most_common_category'])
     
     with col4:
-        favorite_count = sum(1 for r in recipes if r.get('is_favorite', False))
-        st.metric("⭐ Favorites", favorite_count)
+        st.metric("⭐ Favorites", stats['favorite_count'])
 
-#export csv
-if recipes:
+#export (the API streams the file, so nothing is built up here)
+if total:
     st.subheader("💾 Export Data")
-    if st.button("Download Recipes as CSV"):
-        # Flatten recipes for CSV
-        csv_data = []
-        for recipe in recipes:
-            csv_data.append({
-                'Name': recipe['name'],
-                'Category': recipe.get('category', 'Main Course'),
-                'Ingredients': ', '.join(recipe['ingredients']),
-                'Instructions': recipe['instructions'],
-                'Prep Time (min)': recipe['prep_time'],
-                'Difficulty': recipe['difficulty'],
-                'YouTube URL': recipe.get('youtube_url', ''),
-                'Favorite': 'Yes' if recipe.get('is_favorite', False) else 'No',
-                'Created': recipe['created_at']
-            })
-        
-        df = pd.DataFrame(csv_data)
-        csv = df.to_csv(index=False)
-        
-        st.download_button(
-            label="📥 Download CSV",
-            data=csv,
-            file_name="my_recipes.csv",
-            mime="text/csv"
-        )
+    export_format = st.selectbox("Format", ["csv", "ndjson", "parquet"],
+                                 format_func=lambda f: {"csv": "CSV", "ndjson": "JSON lines", "parquet": "Parquet"}[f])
+    st.link_button("📥 Download Recipes", f"{API_URL}/recipes/export?format={export_format}")
 
 st.markdown("---")
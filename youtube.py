@@ -0,0 +1,198 @@
+"""YouTube video ids, and a local disk cache of their thumbnails
+
+The video id is parsed once when a recipe is saved (see models.Recipe), so
+nothing has to run the URL patterns again when recipes are shown.
+
+ThumbnailCache keeps thumbnails as files in one folder. Missing ones are
+fetched by a small thread pool, so at most `workers` downloads run at once
+and a request never waits on YouTube for longer than it asks to. When the
+folder grows past max_bytes the least recently used files are deleted.
+Downloads go through a fetcher function, video id -> image bytes or None,
+so anything (a local stub, another mirror) can stand in for YouTube.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# the URL shapes people paste: watch?v=, youtu.be/, embed/ and v/
+_VIDEO_URL = re.compile(r'(?:youtube\.com/watch\?(?:[^#]*&)?v=|youtu\.be/|youtube\.com/embed/|youtube\.com/v/)'
+                        r'([^&?#/\s]+)')
+
+# what a video id can look like, anything else is never fetched or used in a file name
+_VIDEO_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+THUMBNAIL_URL = 'https://img.youtube.com/vi/{}/mqdefault.jpg'
+
+# how many ids that had no thumbnail are remembered, so they aren't asked for again right away
+MAX_MISSING = 10000
+
+
+def video_id(url):
+    """Return the video id in a YouTube URL, or '' if it isn't one"""
+    match = _VIDEO_URL.search(url or '')
+    if match and _VIDEO_ID.fullmatch(match.group(1)):
+        return match.group(1)
+    return ''
+
+
+def fetch_from_youtube(video_id, timeout=10):
+    """The default fetcher: download the thumbnail from img.youtube.com, None if there isn't one"""
+    # imported here, the UI uses this module for video_id() and shouldn't wait on urllib's imports
+    import urllib.error
+    import urllib.request
+
+    try:
+        with urllib.request.urlopen(THUMBNAIL_URL.format(video_id), timeout=timeout) as response:
+            return response.read()
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+
+class ThumbnailCache:
+    """Thumbnails on disk, downloaded in the background and evicted least recently used first"""
+
+    def __init__(self, folder, fetcher=fetch_from_youtube, max_bytes=100 * 2 ** 20, workers=4,
+                 retry_after=600):
+        self.folder = folder
+        self.fetcher = fetcher
+        self.max_bytes = max_bytes
+        self.retry_after = retry_after  # seconds before asking again for one that wasn't there
+        self.workers = workers
+        self._executor = None  # made by _open()
+        self._lock = threading.Lock()
+        self._sizes = OrderedDict()  # video id -> file size, least recently used first
+        self._total = 0
+        self._pending = {}  # video id -> Future of a download in progress
+        self._missing = {}  # video id -> when the fetcher last came back empty or failed
+
+    def _open(self):
+        """Set up the folder and the download threads the first time the cache is used (lock held)
+
+        Until then creating a ThumbnailCache touches nothing, so importing
+        the app doesn't.
+        """
+        if self._executor is not None:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.jpg'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            elif entry.name.endswith('.tmp'):
+                os.remove(entry.path)  # left over from a download that didn't finish
+        for _, name, size in sorted(files):
+            self._sizes[name] = size
+            self._total += size
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='thumbnails')
+
+    def _path(self, video_id):
+        return os.path.join(self.folder, video_id + '.jpg')
+
+    def get(self, video_id, wait=0):
+        """Return the thumbnail's bytes, or None if it isn't cached (yet)
+
+        A missing thumbnail is queued for download, and with wait the call
+        waits up to that many seconds for it.
+        """
+        if not _VIDEO_ID.fullmatch(video_id or ''):
+            return None
+        with self._lock:
+            self._open()
+            cached = video_id in self._sizes
+            if cached:
+                self._sizes.move_to_end(video_id)
+        if cached:
+            try:
+                with open(self._path(video_id), 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:  # evicted in the meantime, or deleted by hand
+                with self._lock:
+                    self._total -= self._sizes.pop(video_id, 0)
+
+        future = self.prefetch(video_id)
+        if future is None or not wait:
+            return None
+        try:
+            return future.result(timeout=wait)
+        except Exception:
+            return None
+
+    def prefetch(self, video_id):
+        """Queue a download unless the thumbnail is cached or known to be missing
+
+        Returns the download's Future, or None if nothing needs doing.
+        """
+        if not _VIDEO_ID.fullmatch(video_id or ''):
+            return None
+        with self._lock:
+            self._open()
+            if video_id in self._sizes:
+                return None
+            if time.monotonic() - self._missing.get(video_id, -self.retry_after) < self.retry_after:
+                return None
+            future = self._pending.get(video_id)
+            if future is None:
+                future = self._pending[video_id] = self._executor.submit(self._download, video_id)
+            return future
+
+    def _download(self, video_id):
+        try:
+            return self._fetch(video_id)
+        finally:
+            with self._lock:
+                del self._pending[video_id]
+
+    def _fetch(self, video_id):
+        try:
+            data = self.fetcher(video_id)
+        except Exception:
+            data = None
+        if not data:
+            with self._lock:
+                if len(self._missing) >= MAX_MISSING:
+                    del self._missing[next(iter(self._missing))]  # forget the oldest
+                self._missing[video_id] = time.monotonic()
+            return None
+
+        path = self._path(video_id)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._sizes[video_id] = len(data)
+            self._total += len(data)
+            self._missing.pop(video_id, None)
+            evicted = self._evict()
+        for old_id in evicted:
+            try:
+                os.remove(self._path(old_id))
+            except FileNotFoundError:
+                pass
+        return data
+
+    def _evict(self):
+        """Drop least recently used entries until the total fits, returning their ids"""
+        evicted = []
+        # the newest one always stays, even if it's bigger than max_bytes on its own
+        while self._total > self.max_bytes and len(self._sizes) > 1:
+            old_id, size = self._sizes.popitem(last=False)
+            self._total -= size
+            evicted.append(old_id)
+        return evicted
+
+    def stats(self):
+        """Return (files, bytes) currently cached"""
+        with self._lock:
+            self._open()
+            return len(self._sizes), self._total
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)